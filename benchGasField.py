@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Benchmarks simulateField and the figure callbacks over a grid of scenarios.
+#
+#   python benchGasField.py --output bench.json
+#   python benchGasField.py --output new.json --compare bench.json
+#
+# Results are written as JSON, one record per scenario, together with the git
+# commit they were measured at. Timings are the best of --repeat runs of as
+# many loops as timeit's autorange needs to fill 0.2 s, since a simulation
+# takes well under a millisecond. --compare reports every measurement that
+# grew by more than --threshold against an earlier results file, and by more
+# than --min-seconds for timings, and exits non-zero if there were any.
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import plotly
+
+import gasFieldApp as gfa
+import gasFieldSim as gfs
+
+
+SIM_TIMES = (5, 10, 20, 30, 50) # years
+NUM_RIGS = (1, 2, 5, 10, 20)
+DRILL_TIMES = (10, 60) # days
+
+# Measurements compared by --compare; larger is worse for all of them
+METRICS = ('simSeconds', 'simPeakBytes', 'figureSeconds', 'figurePeakBytes', 'payloadBytes')
+TIME_METRICS = ('simSeconds', 'figureSeconds')
+
+
+def scenarios():
+    for simTime, numRigs, drillTime in itertools.product(SIM_TIMES, NUM_RIGS, DRILL_TIMES):
+        yield dict(gfs.DEFAULT_PARAMS, simTime=simTime, numRigs=numRigs, drillTime=drillTime)
+
+# Best wall time per call over repeat timing runs and peak traced memory of one call
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    best = min([elapsed] + timer.repeat(repeat=max(repeat - 1, 0), number=number))/number
+
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+# What the three figure callbacks do for a new scenario, with the caches cleared
+def runCallbacks(params):
+    gfs.simCache.clear()
+    gfs.physicsCache.clear()
+    timeline = gfs.cachedSimulatePhysics(params)
+    tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = gfs.cachedSimulateField(params)
+    return [
+        gfa.declineFigure(timeline.tArr, timeline.decArr),
+        gfa.productionFigure(timeline.tArr, timeline.qArr, timeline.numWellArr, params['tgtFlow']),
+        gfa.costFigure(tArr, expenseArr, incomeArr, exposureArr)
+    ]
+
+def benchScenario(params, repeat):
+    results, simSeconds, simPeakBytes = measure(lambda: gfs.simulateField(params), repeat)
+    figures, figureSeconds, figurePeakBytes = measure(lambda: runCallbacks(params), repeat)
+    payload = json.dumps(figures, cls=plotly.utils.PlotlyJSONEncoder)
+    return {
+        'params': {'simTime': params['simTime'], 'numRigs': params['numRigs'], 'drillTime': params['drillTime']},
+        'numDays': len(results[0]),
+        'numWells': int(results[6][-1]) if len(results[6]) else 0,
+        'simSeconds': simSeconds,
+        'simPeakBytes': simPeakBytes,
+        'figureSeconds': figureSeconds,
+        'figurePeakBytes': figurePeakBytes,
+        'payloadBytes': len(payload)
+    }
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def scenarioKey(record):
+    return tuple(sorted(record['params'].items()))
+
+def compare(records, baseline, threshold, minSeconds=0.0):
+    baseRecords = {scenarioKey(record): record for record in baseline['results']}
+    regressions = []
+    for record in records:
+        base = baseRecords.get(scenarioKey(record))
+        if base is None:
+            continue
+        for metric in METRICS:
+            if metric in TIME_METRICS and record[metric] - base[metric] <= minSeconds:
+                continue
+            if base[metric] > 0 and record[metric] > base[metric]*(1.0 + threshold):
+                regressions.append((record['params'], metric, base[metric], record[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the gas field simulation and figure callbacks')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs per scenario, best is kept')
+    parser.add_argument('--compare', help='earlier results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative growth reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='timings must also grow by this many seconds to be reported')
+    args = parser.parse_args(argv)
+
+    records = []
+    for params in scenarios():
+        record = benchScenario(params, args.repeat)
+        records.append(record)
+        print('%(simTime)2d years %(numRigs)2d rigs %(drillTime)2d day drill:' % record['params'],
+              'sim %.4fs, figures %.4fs, payload %d bytes' % (record['simSeconds'], record['figureSeconds'], record['payloadBytes']),
+              file=sys.stderr)
+
+    output = {'commit': gitCommit(), 'python': sys.version.split()[0], 'results': records}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=1)
+    else:
+        json.dump(output, sys.stdout, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(records, baseline, args.threshold, args.min_seconds)
+        for params, metric, before, after in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g' % (params, metric, before, after), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,516 +1,912 @@
 # -*- coding: utf-8 -*-
-import math
-#from numba import jit
+import os
+
+import numpy as np
 import plotly as ply
 import dash
 import dash_auth
 import dash_core_components as dcc
 import dash_html_components as html
+import flask
 import plotly.graph_objs as go
 
+from gasFieldGrid import ScenarioGrid
+from gasFieldJobs import JobQueue
+from gasFieldMetrics import metrics
+from gasFieldStore import storeFromEnvironment
+from gasFieldSim import (DEFAULT_PARAMS, PHYSICAL_PARAM_KEYS, SIM_PARAM_KEYS, SimulationCache, cachedFieldSummary,
+                         cachedSimulateField, cachedSimulatePhysics, optimizePlan, paramsKey, physicsCache, planCache,
+                         runMonteCarlo, runSensitivity, setResultStore, setScenarioGrid, simCache, summaryCache,
+                         typeCurveCache)
+import gasFieldSim
+
+
+# Setup of Downsampling
+
+# Figures send at most MAX_FIGURE_POINTS points per trace; DOWNSAMPLE_METHOD is
+# 'minmax' (extremes of each bucket), 'lttb' (largest-triangle-three-buckets,
+# smoother but sequential and about ten times slower) or None to send every
+# point. Both are read on each call, so they can be changed at run time.
+MAX_FIGURE_POINTS = 1000
+DOWNSAMPLE_METHOD = 'minmax'
+
+# Indices of numBuckets near-equal buckets of start to end - 1 as the rows of
+# a matrix, shorter buckets padded by repeating their last index
+def bucketIndices(start, end, numBuckets):
+    edges = np.linspace(start, end, numBuckets + 1).astype(int)
+    rows = edges[:-1, None] + np.arange(int(np.max(np.diff(edges))))
+    return np.minimum(rows, edges[1:, None] - 1)
+
+def lttbIndices(x, y, numPoints):
+    size = len(x)
+    if numPoints >= size or numPoints < 3:
+        return np.arange(size)
+
+    # first and last points are kept, the rest split into numPoints - 2 buckets
+    edges = np.linspace(1, size - 1, numPoints - 1).astype(int)
+    rows = bucketIndices(1, size - 1, numPoints - 2)
+    bucketX, bucketY = x[rows], y[rows]
+    counts = np.diff(edges)
+    nextX = np.append(np.add.reduceat(x[:size - 1], edges[:-1])[1:]/counts[1:], x[-1])
+    nextY = np.append(np.add.reduceat(y[:size - 1], edges[:-1])[1:]/counts[1:], y[-1])
+    indices = np.empty(numPoints, dtype=int)
+    indices[0] = 0
+    indices[-1] = size - 1
+
+    # each bucket depends on the point picked from the one before, so only
+    # the area of a bucket's points is vectorized; padding repeats a bucket's
+    # last point, which argmax never prefers over the original
+    a = 0
+    for i in range(numPoints - 2):
+        alpha, beta = x[a] - nextX[i], nextY[i] - y[a]
+        area = np.abs(alpha*bucketY[i] + beta*bucketX[i] - (alpha*y[a] + beta*x[a]))
+        a = rows[i, area.argmax()]
+        indices[i + 1] = a
+    return indices
+
+def minMaxIndices(y, numPoints):
+    size = len(y)
+    if numPoints >= size or numPoints < 2:
+        return np.arange(size)
+
+    # two points per bucket, leaving room for the first and last points
+    numBuckets = (numPoints - 2)//2
+    if numBuckets < 1:
+        return np.array([0, size - 1])
+    rows = bucketIndices(0, size, numBuckets)
+    buckets = np.arange(len(rows))
+    bucketY = y[rows]
+    return np.unique(np.concatenate(([0, size - 1], rows[buckets, bucketY.argmin(axis=1)],
+                                     rows[buckets, bucketY.argmax(axis=1)])))
+
+# x range of a zoomed graph from its relayoutData, or None when fully zoomed out
+def zoomRange(relayoutData):
+    if not relayoutData:
+        return None
+    if 'xaxis.range[0]' in relayoutData:
+        return relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']
+    if 'xaxis.range' in relayoutData:
+        return tuple(relayoutData['xaxis.range'])
+    return None
+
+# Points of a trace to send, limited to xRange (plus one point either side)
+# when zoomed; maxPoints and method default to the module settings
+def decimate(x, y, xRange=None, maxPoints=None, method=None):
+    maxPoints = MAX_FIGURE_POINTS if maxPoints is None else maxPoints
+    method = DOWNSAMPLE_METHOD if method is None else method
+    x = np.asarray(x)[:len(y)]
+    y = np.asarray(y)[:len(x)]
+    if xRange is not None:
+        start = max(np.searchsorted(x, xRange[0]) - 1, 0)
+        end = np.searchsorted(x, xRange[1], side='right') + 1
+        x, y = x[start:end], y[start:end]
+    if method == 'lttb':
+        indices = lttbIndices(x.astype(float), y.astype(float), maxPoints)
+    elif method == 'minmax':
+        indices = minMaxIndices(y, maxPoints)
+    elif method is None:
+        return x, y
+    else:
+        raise ValueError('Unknown downsampling method: %s' % method)
+    return x[indices], y[indices]
 
-# Setup of Classes
-
-class Well(object):
-
-    def __init__(self, flowRate, name='Well ?'):
-        self.name = name
-        self.age = 0
-        self.timeFlowing = 0
-        self.status = 'Standby'
-        self.flowRate = flowRate
-
-    def getName(self):
-        return self.name
 
-    def getAge(self):
-        return self.age
+# Setup of Web App
+VALID_UNAME_PWORD_PAIRS =  [
+    ['Jack', 'Tristar1']
+]
 
-    def setAge(self, age):
-        self.age = age
 
-    def getTimeFlowing(self):
-        return self.timeFlowing
+# Parameter inputs in the layout: (input id, params key, type)
+PARAM_INPUTS = [
+    ('inSimTime', 'simTime', int),
+    ('inTargetFlow', 'tgtFlow', float),
+    ('inNumRigs', 'numRigs', int),
+    ('inDrillTime', 'drillTime', int),
+    ('inWaitFracTime', 'fracWaitTime', int),
+    ('inFracTime', 'fracTime', int),
+    ('inWaitPipeTime', 'pipeWaitTime', int),
+    ('inAveFlow', 'aveFlow', float),
+    ('inAveDecline', 'aveDecline', int),
+    ('inDeclineModel', 'declineModel', str),
+    ('inBFactor', 'bFactor', float),
+    ('inTerminalDecline', 'terminalDecline', float),
+    ('inFlowSpread', 'flowSpread', float),
+    ('inGasPrice', 'gasPrice', float),
+    ('inExchangeRate', 'exchangeRate', float),
+    ('inCostToDrill', 'costToDrill', float),
+    ('inCostToFrac', 'costToFrac', float),
+    ('inCostToTieIn', 'costToTieIn', float)
+]
 
-    def setTimeFlowing(self, time):
-        self.timeFlowing = time
+def readParams(values, inputs=PARAM_INPUTS):
+    return {key: cast(value) for (inputId, key, cast), value in zip(inputs, values)}
+
+# Params each figure depends on, so a new scenario only redraws the figures it changes
+DECLINE_KEYS = PHYSICAL_PARAM_KEYS
+PRODUCTION_KEYS = PHYSICAL_PARAM_KEYS + ('tgtFlow',)
+COST_KEYS = SIM_PARAM_KEYS
+
+# Params of a scenario typed into the inputs; any change is a new submission
+SCENARIO_KEYS = SIM_PARAM_KEYS + ('tgtFlow',)
+
+def figureKey(params, keys):
+    return dict(paramsKey(params, keys))
+
+# Scenarios typed into the inputs are simulated here, off the callback thread
+jobQueue = JobQueue()
+JOB_POLL_INTERVAL = 250 # ms
+
+# Saved scenarios overlaid on the production and cost figures share the point
+# budget of a trace, down to MIN_OVERLAY_POINTS each
+MIN_OVERLAY_POINTS = 250
+
+overlayCache = SimulationCache()
+
+# Params sampled by the uncertainty analysis view
+UNCERTAIN_PARAM_KEYS = ('aveFlow', 'aveDecline', 'drillTime', 'gasPrice')
+
+def zoomLayout(xRange):
+    xaxis = {'title': 'Field Days'}
+    if xRange is not None:
+        xaxis['range'] = list(xRange)
+    return xaxis
+
+def declineFigure(tArr, decArr, xRange=None):
+    x, y = decimate(tArr, decArr, xRange)
+    return {
+        'data': [
+            go.Scatter(
+                x=x,
+                y=y,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'white'}
+                },
+                name='Gas Production'
+            )
+        ],
+        'layout': go.Layout(
+            xaxis=zoomLayout(xRange),
+            yaxis={'title': 'Production (scf/day)'},
+            margin={'l': 60, 'b': 40, 't': 10, 'r': 10},
+            legend={'x': 0, 'y': 1},
+            hovermode='closest'
+        )
+    }
+
+def productionFigure(tArr, qArr, numWellArr, tgtFlow, xRange=None, overlays=()):
+    qX, qY = decimate(tArr, qArr, xRange)
+    wellX, wellY = decimate(tArr, numWellArr, xRange)
+    return {
+        'data': [
+            go.Scatter(
+                x=qX,
+                y=qY,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'white'}
+                },
+                name='Field Production'
+            ),
+            go.Scatter(
+                x=[0, tArr[-1]],
+                y=[tgtFlow*947817.12, tgtFlow*947817.12],
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'red'}
+                },
+                name='Target Production'
+            ),
+            go.Scatter(
+                x=wellX,
+                y=wellY,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'red'}
+                },
+                name='Well Count',
+                yaxis='y2'
+            )
+        ] + list(overlays),
+        'layout': go.Layout(
+            xaxis=zoomLayout(xRange),
+            yaxis={'title': 'Production (scf/day)'},
+            yaxis2={
+                'title': 'Well Count',
+                'overlaying': 'y',
+                'side': 'right'
+            },
+            margin={'l': 60, 'b': 40, 't': 10, 'r': 60},
+            legend={'x': 0, 'y': 1},
+            hovermode='closest'
+        )
+    }
+
+def costFigure(tArr, expenseArr, incomeArr, exposureArr, xRange=None, overlays=()):
+    expenseX, expenseY = decimate(tArr, expenseArr, xRange)
+    incomeX, incomeY = decimate(tArr, incomeArr, xRange)
+    exposureX, exposureY = decimate(tArr, exposureArr, xRange)
+    return {
+        'data': [
+            go.Scatter(
+                x=expenseX,
+                y=expenseY,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'white'}
+                },
+                name='Total Expenses'
+            ),
+            go.Scatter(
+                x=incomeX,
+                y=incomeY,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'red'}
+                },
+                name='Total Income'
+            ),
+            go.Scatter(
+                x=exposureX,
+                y=exposureY,
+                mode='lines',
+                opacity=0.7,
+                marker={
+                    'size': 15,
+                    'line': {'width': 0.5, 'color': 'red'}
+                },
+                name='Capital Exposure',
+                yaxis='y2'
+            )
+        ] + list(overlays),
+        'layout': go.Layout(
+            xaxis=zoomLayout(xRange),
+            yaxis={'title': 'Cost ($)'},
+            yaxis2={
+                'title': 'Captial Exposure ($)',
+                'overlaying': 'y',
+                'side': 'right'
+            },
+            margin={'l': 60, 'b': 40, 't': 10, 'r': 60},
+            legend={'x': 0, 'y': 1},
+            hovermode='closest'
+        )
+    }
+
+# Saved scenarios (name, params) of the library selected for comparison
+def savedScenarios(names, library):
+    library = library or {}
+    return [(name, dict(DEFAULT_PARAMS, **library[name])) for name in names or () if name in library]
+
+# A saved scenario's series ('qArr' or 'exposureArr'), decimated. Cached, as
+# the scenarios compared rarely change while the current one is edited.
+def overlaySeries(params, series, maxPoints, xRange=None):
+    key = (series, paramsKey(params), maxPoints, DOWNSAMPLE_METHOD, xRange)
+    points = overlayCache.get(key)
+    if points is None:
+        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = cachedSimulateField(params)
+        points = decimate(tArr, {'qArr': qArr, 'exposureArr': exposureArr}[series], xRange, maxPoints)
+        overlayCache.put(key, points)
+    return points
+
+# Dotted trace of an overlaySeries
+def overlayTrace(name, points, yaxis='y'):
+    x, y = points
+    return {
+        'type': 'scatter',
+        'x': x,
+        'y': y,
+        'mode': 'lines',
+        'opacity': 0.7,
+        'line': {'dash': 'dot', 'width': 1.5},
+        'name': name,
+        'yaxis': yaxis
+    }
+
+def overlayPoints(scenarios):
+    return max(MAX_FIGURE_POINTS//max(len(scenarios), 1), MIN_OVERLAY_POINTS)
+
+def bandFigure(tArr, bands, yTitle):
+    percentiles = sorted(bands)
+    highX, highY = decimate(tArr, bands[percentiles[-1]])
+    lowX, lowY = decimate(tArr, bands[percentiles[0]])
+    data = [
+        go.Scatter(
+            x=highX,
+            y=highY,
+            mode='lines',
+            line={'width': 0},
+            name='P%d' % percentiles[-1]
+        ),
+        go.Scatter(
+            x=lowX,
+            y=lowY,
+            mode='lines',
+            line={'width': 0},
+            fill='tonexty',
+            name='P%d' % percentiles[0]
+        )
+    ]
+    for percentile in percentiles[1:-1]:
+        x, y = decimate(tArr, bands[percentile])
+        data.append(go.Scatter(
+            x=x,
+            y=y,
+            mode='lines',
+            opacity=0.7,
+            name='P%d' % percentile
+        ))
+    return {
+        'data': data,
+        'layout': go.Layout(
+            xaxis={'title': 'Field Days'},
+            yaxis={'title': yTitle},
+            margin={'l': 60, 'b': 40, 't': 10, 'r': 10},
+            legend={'x': 0, 'y': 1},
+            hovermode='closest'
+        )
+    }
+
+
+def tornadoFigure(rows, lowKey, highKey, xTitle):
+    rows = rows[::-1]
+    labels = [row['key'] for row in rows]
+    return {
+        'data': [
+            go.Bar(
+                y=labels,
+                x=[row[lowKey] for row in rows],
+                orientation='h',
+                opacity=0.7,
+                name='Low'
+            ),
+            go.Bar(
+                y=labels,
+                x=[row[highKey] for row in rows],
+                orientation='h',
+                opacity=0.7,
+                name='High'
+            )
+        ],
+        'layout': go.Layout(
+            barmode='overlay',
+            xaxis={'title': xTitle},
+            margin={'l': 100, 'b': 40, 't': 10, 'r': 10},
+            legend={'x': 0, 'y': 1},
+            hovermode='closest'
+        )
+    }
+
+
+# Headline economics of a scenario, from its cached FieldSummary
+def summaryChildren(summary):
+    rates = sorted(summary.npv)
+    return [
+        html.Div(className="four columns", children=[
+            html.P('NPV @ %g%% ($): %.4g' % (100*rate, summary.npv[rate])) for rate in rates
+        ]),
 
-    def getStatus(self):
-        return self.status
+        html.Div(className="four columns", children=[
+            html.P('Breakeven Gas Price @ %g%% ($USD/GJ): %s' % (100*rate, '-' if summary.breakevenGasPrice[rate] is None
+                                                                 else '%.2f' % summary.breakevenGasPrice[rate]))
+            for rate in rates
+        ]),
 
-    def setStatus(self, status):
-        self.status = status
+        html.Div(className="four columns", children=[
+            html.P('IRR (%%/year): %s' % ('-' if summary.irr is None else '%.1f' % (100*summary.irr))),
+            html.P('Payback (Field Days): %s' % ('-' if summary.paybackDay is None else summary.paybackDay)),
+            html.P('Peak Capital Exposure ($): %.4g' % summary.peakExposure),
+            html.P('Total Income ($): %.4g' % summary.totalIncome),
+            html.P('Total Expense ($): %.4g' % summary.totalExpense)
+        ])
+    ]
 
-    def getFlow(self):
-        return self.flowRate
 
-    def setFlow(self, flow):
-        self.flowRate = flow
+# Layout is a function so nothing is simulated until a page is first served;
+# the default scenario then comes from the simulation cache
+def serveLayout():
+    params = DEFAULT_PARAMS
+    tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = cachedSimulateField(params)
 
+    return html.Div(className='container-fluid', children=[
 
-class Field(object):
+        html.Div(className="row", children=[
+            html.H1(children='Gas Field Development Tool'),
 
-    def __init__(self, name):
-        self.name = name
-        self.wells = []
-        self.numWells = 0
-        self.flowRate = 0
+            html.Div('A web app analysis tool for natural gas field develop (based on no water)')
+        ]),
 
-    def getFlow(self):
-        flow = 0.0
-        for well in wells:
-            flow += well.getFlow()
-        return flow
+        dcc.Store(id='job-store'),
+        dcc.Store(id='sim-params'),
+        dcc.Store(id='decline-vs-time-key', data=figureKey(params, DECLINE_KEYS)),
+        dcc.Store(id='prod-vs-time-key', data=figureKey(params, PRODUCTION_KEYS)),
+        dcc.Store(id='cost-vs-time-key', data=figureKey(params, COST_KEYS)),
+        dcc.Interval(id='job-poll', interval=JOB_POLL_INTERVAL, disabled=True),
+        # named params saved for comparison, kept in the browser between visits
+        dcc.Store(id='scenario-library', storage_type='local'),
+
+        html.Div(id='graphs', className="row", children=[
+
+            html.Div(className="four columns", children=[
+                dcc.Graph(
+                    id='decline-vs-time',
+                    figure=declineFigure(tArr, decArr)
+                )
+            ]),
+
+            html.Div(className="four columns", children=[
+                dcc.Graph(
+                    id='prod-vs-time',
+                    figure=productionFigure(tArr, qArr, numWellArr, params['tgtFlow'])
+                )
+            ]),
+
+            html.Div(className="four columns", children=[
+                dcc.Graph(
+                    id='cost-vs-time',
+                    figure=costFigure(tArr, expenseArr, incomeArr, exposureArr)
+                )
+            ])
+        ]),
 
+        html.Div(id='job-progress', className="row", children=[]),
 
-# Setup of Functions
+        html.Div(id='field-summary', className="row", children=summaryChildren(cachedFieldSummary(params))),
 
-# Decline curve
-def decline(qi, d, t):
-    return qi*math.exp(-d*t)
+        html.Div(className="row", children=[
+            html.Div(className="three columns", children=[
+                html.H3('Scenario Library'),
 
-#@jit(nopython=True)
-def simulateField(params):
-    # economic parameters
-    gasPriceRaw = params['gasPrice'] #3.0 # USD/GJ
-    USDAUD = params['exchangeRate'] #1.31 # $
-    gasPrice = gasPriceRaw*USDAUD # AUD/GJ
-    costToDrill = params['costToDrill']*1.0E6 #3.0E6 # $
-    costToFrac = params['costToFrac']*1.0E6 #2.0E6 # $
-    costToTieIn = params['costToTieIn']*1.0E6 #0.5E6 # $
+                html.Div(className="text-center", children=[
+                    html.Label('Scenario Name'),
+                    dcc.Input(value='', type='text', id='inScenarioName'),
 
-    # reservoir parameters
-    aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
-    aveDeclineTime = params['aveDecline']*365.0 # days to 10%
-    expParam = 2.30259/aveDeclineTime # param for exp decline curve
+                    html.Button('Save', id='scenarioSave')
+                ])
+            ]),
 
-    # well construction parameters
-    drillTime = params['drillTime'] # days
-    drillToFracTime = params['fracWaitTime'] # days
-    fracTime = params['fracTime'] # days
-    fracToFlowTime = params['pipeWaitTime'] # days
-    totalNonFlowTime = drillTime + drillToFracTime + fracTime + fracToFlowTime # days
+            html.Div(className="nine columns", children=[
+                html.Label('Compare With'),
+                dcc.Dropdown(id='compare-scenarios', options=[], value=[], multi=True,
+                             placeholder='Saved scenarios to overlay on the production and cost figures')
+            ])
+        ]),
 
-    # field construction parameters
-    rigsOperating = params['numRigs']
+        html.Div(className="row", children=[
+            html.Div(className="three columns", children=[
+                html.H3('Simulation Parameters'),
 
-    # target flow rate
-    flowTarget = params['tgtFlow'] # TJ/day
-    flowTargetCF = flowTarget*947817.12 # cubicfeet/day
+                html.Div(className="text-center", children=[
+                    html.Label('Target Flow (TJ/Day)'),
+                    dcc.Input(value='25.0', type='number', id='inTargetFlow', debounce=True),
 
-    # simulation parameters
-    t_init = 0.0
-    t_fin = params['simTime']*365.0
+                    html.Label('Simulation Time (years)'),
+                    dcc.Input(value='5', type='number', id='inSimTime', debounce=True),
 
-    # Algorithm
+                    html.Label('Number of Rigs'),
+                    dcc.Input(value='2', type='number', id='inNumRigs', debounce=True),
 
-    field = Field('Fairfields')
-    field.wells = [Well(aveMaxFlow) for i in range(rigsOperating)]
+                ])
+            ]),
 
-    tArr = []
-    qArr = []
-    decArr = []
+            html.Div(className="three columns", children=[
+                html.H3('Field Construction Parameters'),
 
-    expenseArr = []
-    incomeArr = []
-    exposureArr = []
-    numWellArr = []
+                html.Div(className="text-center", children=[
+                    html.Label('Well Drilling Time (Days)'),
+                    dcc.Input(value='30', type='number', id='inDrillTime', debounce=True),
 
-    fieldExpense = 0
-    fieldIncome = 0
+                    html.Label('Time Waiting on Frac (Days)'),
+                    dcc.Input(value='60', type='number', id='inWaitFracTime', debounce=True),
 
-    t = 0
-    while t <= t_fin:
-        fieldFlow = 0.0
+                    html.Label('Well Frac Time (Days)'),
+                    dcc.Input(value='10', type='number', id='inFracTime', debounce=True),
 
-        if t%drillTime == 0 and t > 1:
-            field.wells = field.wells + [Well(aveMaxFlow) for i in range(rigsOperating)]
+                    html.Label('Time Waiting on Piping (Days)'),
+                    dcc.Input(value='160', type='number', id='inWaitPipeTime', debounce=True)
+                ])
+            ]),
 
-        for well in field.wells:
+            html.Div(className="three columns", children=[
+                html.H3('Reservoir Parameters'),
 
-            # Add to Field Expense
-            if well.age == drillTime:
-                fieldExpense += costToDrill
-            if well.age == drillTime + drillToFracTime + fracTime:
-                fieldExpense += costToFrac
-            if well.age == totalNonFlowTime:
-                fieldExpense += costToTieIn
+                html.Div(className="text-center", children=[
+                    html.Label('Ave Max Well Flow (Mscf/day)'),
+                    dcc.Input(value='1.0', type='number', id='inAveFlow', debounce=True),
 
-            timeFlowing = well.age - totalNonFlowTime
+                    html.Label('Ave Time to 10% Flow (years)'),
+                    dcc.Input(value='4', type='number', id='inAveDecline', debounce=True),
 
-            if timeFlowing > 0:
-                flowRate = decline(aveMaxFlow, expParam, timeFlowing)
-                well.flowRate = flowRate
+                    html.Label('Decline Model'),
+                    dcc.Dropdown(
+                        id='inDeclineModel',
+                        options=[
+                            {'label': 'Exponential', 'value': 'exponential'},
+                            {'label': 'Hyperbolic', 'value': 'hyperbolic'},
+                            {'label': 'Harmonic', 'value': 'harmonic'},
+                            {'label': 'Modified Hyperbolic', 'value': 'modifiedHyperbolic'}
+                        ],
+                        value='exponential',
+                        clearable=False
+                    ),
 
-                if field.wells.index(well) == 0:
-                    decArr.append(flowRate)
+                    html.Label('Hyperbolic b Factor'),
+                    dcc.Input(value='0.5', type='number', id='inBFactor', debounce=True),
 
-                fieldFlow += flowRate
+                    html.Label('Terminal Decline (%/year)'),
+                    dcc.Input(value='5', type='number', id='inTerminalDecline', debounce=True),
 
-                fieldIncome += gasPrice*flowRate/947.8171
+                    html.Label('Well Flow Spread (log sd)'),
+                    dcc.Input(value='0', type='number', id='inFlowSpread', debounce=True)
+                ])
+            ]),
 
-            well.age += 1
+            html.Div(className="three columns", children=[
+                html.H3('Economic Parameters'),
 
-        tArr.append(t)
-        qArr.append(fieldFlow)
-        expenseArr.append(fieldExpense)
-        incomeArr.append(fieldIncome)
-        exposureArr.append(fieldIncome - fieldExpense)
-        numWellArr.append(len(field.wells))
+                html.Div(className="text-center", children=[
+                    html.Label('Gas Price ($USD/GJ)'),
+                    dcc.Input(value='10.0', type='number', id='inGasPrice', debounce=True),
 
-        t += 1
+                    html.Label('Exchange Rate ($AUD/$USD)'),
+                    dcc.Input(value='1.31', type='number', id='inExchangeRate', debounce=True),
 
-    return tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr
+                    html.Label('Cost To Drill ($M)'),
+                    dcc.Input(value='3.0', type='number', id='inCostToDrill', debounce=True),
 
+                    html.Label('Cost To Frac ($M)'),
+                    dcc.Input(value='2.0', type='number', id='inCostToFrac', debounce=True),
 
-# Setup of Web App
-VALID_UNAME_PWORD_PAIRS =  [
-    ['Jack', 'Tristar1']
-]
-
-
-app = dash.Dash('auth')
-auth = dash_auth.BasicAuth(
-    app,
-    VALID_UNAME_PWORD_PAIRS
-)
+                    html.Label('Cost To Tie In ($M)'),
+                    dcc.Input(value='0.5', type='number', id='inCostToTieIn', debounce=True)
+                ])
+            ])
+        ]),
 
-#app.css.append_css({"external_url": "https://codepen.io/chriddyp/pen/bWLwgP.css"})
-app.css.append_css({'external_url': 'https://cdn.rawgit.com/plotly/dash-app-stylesheets/2d266c578d2a6e8850ebce48fdb52759b2aef506/stylesheet-oil-and-gas.css'})
-#app.css.append_css({"external_url": "https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/css/bootstrap-theme.min.css"})
+        html.Div(className="row", children=[
+            html.Div(className="three columns", children=[
+                html.H3('Uncertainty Analysis'),
 
+                html.Div(className="text-center", children=[
+                    html.Label('Number of Samples'),
+                    dcc.Input(value='500', type='number', id='inMcSamples'),
 
-# INITIAL RUN OF SIM
-params = {
-    'simTime': 5,
-    'tgtFlow': 25.0,
-    'numRigs': 2,
-    'drillTime': 30,
-    'fracWaitTime': 60,
-    'fracTime': 10,
-    'pipeWaitTime': 160,
-    'aveFlow': 1.0,
-    'aveDecline': 4,
-    'gasPrice': 10.0,
-    'exchangeRate': 1.31,
-    'costToDrill': 3.0,
-    'costToFrac': 2.0,
-    'costToTieIn': 0.5
-}
+                    html.Label('Uncertainty (+/- %)'),
+                    dcc.Input(value='20', type='number', id='inMcSpread'),
 
-tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = simulateField(params)
+                    html.Button('Run', id='mcRun')
+                ])
+            ]),
 
-app.layout = html.Div(className='container-fluid', children=[
+            html.Div(id='mc-graphs', className="nine columns", children=[])
+        ]),
 
-    html.Div(className="row", children=[
-        html.H1(children='Gas Field Development Tool'),
+        html.Div(className="row", children=[
+            html.Div(className="three columns", children=[
+                html.H3('Sensitivity Analysis'),
 
-        html.Div('A web app analysis tool for natural gas field develop (based on no water)')
-    ]),
+                html.Div(className="text-center", children=[
+                    html.Label('Perturbation (+/- %)'),
+                    dcc.Input(value='10', type='number', id='inSensSpread'),
 
-    html.Div(id='graphs', className="row", children=[
+                    html.Label('Discount Rate (%/year)'),
+                    dcc.Input(value='10', type='number', id='inDiscountRate'),
 
-        html.Div(className="four columns", children=[
-            dcc.Graph(
-                id='decline-vs-time',
-                figure={
-                    'data': [
-                        go.Scatter(
-                            x=tArr,
-                            y=decArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
-                            name='Gas Production'
-                        )
-                    ],
-                    'layout': go.Layout(
-                        xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Production (scf/day)'},
-                        margin={'l': 60, 'b': 40, 't': 10, 'r': 10},
-                        legend={'x': 0, 'y': 1},
-                        hovermode='closest'
-                    )
-                }
-            )
-        ]),
+                    html.Button('Run', id='sensRun')
+                ])
+            ]),
 
-        html.Div(className="four columns", children=[
-            dcc.Graph(
-                id='prod-vs-time',
-                figure={
-                    'data': [
-                        go.Scatter(
-                            x=tArr,
-                            y=qArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
-                            name='Field Production'
-                        ),
-                        go.Scatter(
-                            x=[0, tArr[-1]],
-                            y=[params['tgtFlow']*947817.12, params['tgtFlow']*947817.12],
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Target Production'
-                        ),
-                        go.Scatter(
-                            x=tArr,
-                            y=numWellArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Well Count',
-                            yaxis='y2'
-                        )
-                    ],
-                    'layout': go.Layout(
-                        xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Production (scf/day)'},
-                        yaxis2={
-                            'title': 'Well Count',
-                            'overlaying': 'y',
-                            'side': 'right'
-                        },
-                        margin={'l': 60, 'b': 40, 't': 10, 'r': 60},
-                        legend={'x': 0, 'y': 1},
-                        hovermode='closest'
-                    )
-                }
-            )
+            html.Div(id='sens-graphs', className="nine columns", children=[])
         ]),
 
-        html.Div(className="four columns", children=[
-            dcc.Graph(
-                id='cost-vs-time',
-                figure={
-                    'data': [
-                        go.Scatter(
-                            x=tArr,
-                            y=expenseArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
-                            name='Total Expenses'
-                        ),
-                        go.Scatter(
-                            x=tArr,
-                            y=incomeArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Total Income'
-                        ),
-                        go.Scatter(
-                            x=tArr,
-                            y=exposureArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Capital Exposure',
-                            yaxis='y2'
-                        )
-                    ],
-                    'layout': go.Layout(
-                        xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Cost ($)'},
-                        yaxis2={
-                            'title': 'Captial Exposure ($)',
-                            'overlaying': 'y',
-                            'side': 'right'
-                        },
-                        margin={'l': 60, 'b': 40, 't': 10, 'r': 60},
-                        legend={'x': 0, 'y': 1},
-                        hovermode='closest'
-                    )
-                }
-            )
-        ])
-    ]),
-
-    html.Div(className="row", children=[
-        html.Div(className="three columns", children=[
-            html.H3('Simulation Parameters'),
+        html.Div(className="row", children=[
+            html.Div(className="three columns", children=[
+                html.H3('Development Optimizer'),
 
-            html.Div(className="text-center", children=[
-                html.Label('Target Flow (TJ/Day)'),
-                dcc.Input(value='25.0', type='number', id='inTargetFlow'),
+                html.Div(className="text-center", children=[
+                    html.Label('Plateau Time (years)'),
+                    dcc.Input(value='2', type='number', id='inPlateauTime'),
 
-                html.Label('Simulation Time (years)'),
-                dcc.Input(value='5', type='number', id='inSimTime'),
+                    html.Label('Max Number of Rigs'),
+                    dcc.Input(value='20', type='number', id='inMaxRigs'),
 
-                html.Label('Number of Rigs'),
-                dcc.Input(value='2', type='number', id='inNumRigs'),
+                    html.Button('Run', id='optRun')
+                ])
+            ]),
 
-            ])
+            html.Div(id='opt-results', className="nine columns", children=[])
         ]),
 
+        html.Div(className="row", children=[
+            html.Div(className="six columns", children=[
+                html.H3('Operational Phases')
+            ]),
 
-        html.Div(className="three columns", children=[
-            html.H3('Field Construction Parameters'),
-
-            html.Div(className="text-center", children=[
-                html.Label('Well Drilling Time (Days)'),
-                dcc.Input(value='30', type='number', id='inDrillTime'),
-
-                html.Label('Time Waiting on Frac (Days)'),
-                dcc.Input(value='60', type='number', id='inWaitFracTime'),
-
-                html.Label('Well Frac Time (Days)'),
-                dcc.Input(value='10', type='number', id='inFracTime'),
+            html.Div(className="six columns", children=[])
+        ])
 
-                html.Label('Time Waiting on Piping (Days)'),
-                dcc.Input(value='160', type='number', id='inWaitPipeTime')
-            ])
-        ]),
+    ])
 
-        html.Div(className="three columns", children=[
-            html.H3('Reservoir Parameters'),
 
-            html.Div(className="text-center", children=[
-                html.Label('Ave Max Well Flow (Mscf/day)'),
-                dcc.Input(value='1.0', type='number', id='inAveFlow'),
+# Submits params as a background job, replacing (and cancelling) the job
+# replaces, and returns the update_job outputs for it. job-store keeps the
+# params with the job id, so they can be submitted again if need be.
+def submitJob(params, key, replaces=None):
+    with metrics.stage('submit'):
+        job = jobQueue.submit(params, replaces=replaces)
+    metrics.note(jobStatus=job.status)
+    stored = {'id': job.id, 'key': key, 'params': params}
+    if job.isFinished():
+        return stored, True, [], params
+    return stored, False, [html.P('Queued')], dash.no_update
+
+# Submits the scenario in the inputs as a background job, replacing (and
+# cancelling) the previous one, then polls it, showing its status while it
+# is queued or running. Once it is done its params go to sim-params, which
+# redraws the figures from the cache. The inputs are debounced, so they only
+# fire on enter or losing focus, and a scenario that is already running or
+# shown is not submitted again. A poll that reaches a worker process which
+# does not know the job (several workers without a shared GASFIELD_STORE)
+# submits its params again there rather than dropping the scenario.
+def update_job(nIntervals, *values):
+        values, job = values[:-1], values[-1]
+        triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+        if job is None or 'job-poll.n_intervals' not in triggered:
+            try:
+                params = readParams(values)
+            except (TypeError, ValueError):
+                # an input is empty or half typed; wait for a complete scenario
+                return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            key = figureKey(params, SCENARIO_KEYS)
+            if job is not None and job.get('key') == key and jobQueue.isLive(job['id']):
+                # e.g. enter then blur on the same value: already running or shown
+                return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            return submitJob(params, key, replaces=job and job['id'])
+
+        stored, job = job, jobQueue.get(job['id'])
+        if job is None:
+            return submitJob(stored['params'], stored['key'])
+        metrics.note(jobStatus=job.status, jobProgress=job.progress, jobSeconds=job.seconds)
+        if job.status == 'cancelled':
+            return dash.no_update, True, [], dash.no_update
+        if job.status == 'failed':
+            return dash.no_update, True, [html.P('Simulation failed: %s' % job.error)], dash.no_update
+        if job.status == 'done':
+            return dash.no_update, True, [], job.params
+
+        status = 'Queued' if job.status == 'queued' else 'Simulating...'
+        return dash.no_update, False, [html.P(status)], dash.no_update
+
+
+# Figures redraw when sim-params brings a scenario that changes them, when
+# zoomed (relayoutData is an input too, so the visible range is redrawn at
+# full resolution) or when the saved scenarios compared change. Each figure
+# remembers the params it shows in its key store.
+def figureUpdate(params, shownKey, keys):
+        if params is None:
+            return None
+        triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+        key = figureKey(params, keys)
+        if key == shownKey and not any(prop.endswith('.relayoutData') or prop == 'compare-scenarios.value'
+                                       for prop in triggered):
+            return None
+        return key
+
+# The cached simulations, timed as the 'simulate' stage of the request with
+# the cache outcome, series length and well count noted
+def timedSimulatePhysics(params):
+    if metrics.enabled:
+        metrics.note(cache='hit' if paramsKey(params, PHYSICAL_PARAM_KEYS) in physicsCache else 'miss')
+    with metrics.stage('simulate'):
+        timeline = cachedSimulatePhysics(params)
+    metrics.note(numDays=len(timeline.tArr), numWells=int(timeline.numWellArr[-1]) if len(timeline.tArr) else 0)
+    return timeline
+
+def timedSimulateField(params):
+    if metrics.enabled:
+        metrics.note(cache='hit' if paramsKey(params) in simCache else 'miss')
+    with metrics.stage('simulate'):
+        results = cachedSimulateField(params)
+    metrics.note(numDays=len(results[0]), numWells=int(results[6][-1]) if len(results[0]) else 0)
+    return results
+
+def update_decline_graph(params, relayoutData, shownKey):
+        key = figureUpdate(params, shownKey, DECLINE_KEYS)
+        if key is None:
+            return dash.no_update, dash.no_update
+        timeline = timedSimulatePhysics(params)
+        with metrics.stage('figure'):
+            return declineFigure(timeline.tArr, timeline.decArr, zoomRange(relayoutData)), key
+
+
+def update_prod_graph(params, relayoutData, compared, shownKey, library):
+        key = figureUpdate(params, shownKey, PRODUCTION_KEYS)
+        if key is None:
+            return dash.no_update, dash.no_update
+        timeline = timedSimulatePhysics(params)
+        xRange = zoomRange(relayoutData)
+        scenarios = savedScenarios(compared, library)
+        overlays = []
+        with metrics.stage('compare'):
+            maxPoints = overlayPoints(scenarios)
+            for name, savedParams in scenarios:
+                overlays.append(overlayTrace(name, overlaySeries(savedParams, 'qArr', maxPoints, xRange)))
+        metrics.note(compared=len(scenarios))
+        with metrics.stage('figure'):
+            return productionFigure(timeline.tArr, timeline.qArr, timeline.numWellArr, params['tgtFlow'],
+                                    xRange, overlays), key
+
+
+def update_cost_graph(params, relayoutData, compared, shownKey, library):
+        key = figureUpdate(params, shownKey, COST_KEYS)
+        if key is None:
+            return dash.no_update, dash.no_update
+        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = timedSimulateField(params)
+        xRange = zoomRange(relayoutData)
+        scenarios = savedScenarios(compared, library)
+        overlays = []
+        with metrics.stage('compare'):
+            maxPoints = overlayPoints(scenarios)
+            for name, savedParams in scenarios:
+                overlays.append(overlayTrace('%s Exposure' % name, overlaySeries(savedParams, 'exposureArr', maxPoints, xRange),
+                                             'y2'))
+        metrics.note(compared=len(scenarios))
+        with metrics.stage('figure'):
+            return costFigure(tArr, expenseArr, incomeArr, exposureArr, xRange, overlays), key
+
+
+# Saves the scenario in the inputs to the library under its name, replacing
+# one of the same name, and adds it to the scenarios compared
+def update_library(nClicks, name, library, compared, *values):
+        if not nClicks:
+            return dash.no_update, dash.no_update
+        try:
+            params = readParams(values)
+        except (TypeError, ValueError):
+            return dash.no_update, dash.no_update
+        library = dict(library or {})
+        name = (name or '').strip() or 'Scenario %d' % (len(library) + 1)
+        library[name] = params
+        compared = [saved for saved in compared or () if saved != name] + [name]
+        return library, compared
+
+
+def update_library_options(library):
+        return [{'label': name, 'value': name} for name in sorted(library or {})]
+
+
+def update_summary(params):
+        if params is None:
+            return dash.no_update
+        with metrics.stage('summary'):
+            return summaryChildren(cachedFieldSummary(params))
+
+
+def update_mc_graph(nClicks, inMcSamples, inMcSpread, *values):
+        if not nClicks:
+            return []
+
+        params = readParams(values)
+        spread = float(inMcSpread)/100.0
+        distributions = {
+            key: ('triangular', params[key]*(1.0 - spread), params[key], params[key]*(1.0 + spread))
+            for key in UNCERTAIN_PARAM_KEYS
+        } if spread > 0 else {}
+        with metrics.stage('analysis'):
+            bands = runMonteCarlo(params, distributions, max(int(inMcSamples), 1))
+        tArr = cachedSimulateField(params)[0]
 
-                html.Label('Ave Time to 10% Flow (years)'),
-                dcc.Input(value='4', type='number', id='inAveDecline')
-            ])
+        return [
+        html.Div(className="six columns", children=[
+            dcc.Graph(
+                id='mc-prod-vs-time',
+                figure=bandFigure(tArr, bands['qArr'], 'Production (scf/day)')
+            )
         ]),
 
-        html.Div(className="three columns", children=[
-            html.H3('Economic Parameters'),
+        html.Div(className="six columns", children=[
+            dcc.Graph(
+                id='mc-exposure-vs-time',
+                figure=bandFigure(tArr, bands['exposureArr'], 'Captial Exposure ($)')
+            )
+        ])
+        ]
 
-            html.Div(className="text-center", children=[
-                html.Label('Gas Price ($USD/GJ)'),
-                dcc.Input(value='10.0', type='number', id='inGasPrice'),
 
-                html.Label('Exchange Rate ($AUD/$USD)'),
-                dcc.Input(value='1.31', type='number', id='inExchangeRate'),
+def update_sens_graph(nClicks, inSensSpread, inDiscountRate, *values):
+        if not nClicks:
+            return []
 
-                html.Label('Cost To Drill ($M)'),
-                dcc.Input(value='3.0', type='number', id='inCostToDrill'),
+        params = readParams(values)
+        with metrics.stage('analysis'):
+            sensitivity = runSensitivity(params, float(inSensSpread)/100.0, float(inDiscountRate)/100.0)
 
-                html.Label('Cost To Frac ($M)'),
-                dcc.Input(value='2.0', type='number', id='inCostToFrac'),
+        return [
+        html.Div(className="six columns", children=[
+            dcc.Graph(
+                id='sens-npv',
+                figure=tornadoFigure(sensitivity['rows'], 'npvLow', 'npvHigh', 'Change in NPV ($)')
+            )
+        ]),
 
-                html.Label('Cost To Tie In ($M)'),
-                dcc.Input(value='0.5', type='number', id='inCostToTieIn')
-            ])
+        html.Div(className="six columns", children=[
+            dcc.Graph(
+                id='sens-exposure',
+                figure=tornadoFigure(sensitivity['rows'], 'exposureLow', 'exposureHigh', 'Change in Peak Exposure ($)')
+            )
         ])
-    ]),
+        ]
 
-    html.Div(className="row", children=[
-        html.Div(className="six columns", children=[
-            html.H3('Operational Phases')
-        ]),
 
-        html.Div(className="six columns", children=[])
-    ])
+def update_opt_results(nClicks, inPlateauTime, inMaxRigs, *values):
+        if not nClicks:
+            return []
+
+        params = readParams(values)
+        with metrics.stage('analysis'):
+            result = optimizePlan(params, float(inPlateauTime), int(inMaxRigs))
+        best = result['best']
+        if best is None:
+            return [html.P('No plan reaches the target flow (%d plans evaluated)' % result['evaluated'])]
 
-])
-
-
-@app.callback(dash.dependencies.Output('graphs', component_property='children'),
-             [dash.dependencies.Input('inSimTime', 'value'),
-             dash.dependencies.Input('inTargetFlow', 'value'),
-             dash.dependencies.Input('inNumRigs', 'value'),
-             dash.dependencies.Input('inDrillTime', 'value'),
-             dash.dependencies.Input('inWaitFracTime', 'value'),
-             dash.dependencies.Input('inFracTime', 'value'),
-             dash.dependencies.Input('inWaitPipeTime', 'value'),
-             dash.dependencies.Input('inAveFlow', 'value'),
-             dash.dependencies.Input('inAveDecline', 'value'),
-             dash.dependencies.Input('inGasPrice', 'value'),
-             dash.dependencies.Input('inExchangeRate', 'value'),
-             dash.dependencies.Input('inCostToDrill', 'value'),
-             dash.dependencies.Input('inCostToFrac', 'value'),
-             dash.dependencies.Input('inCostToTieIn', 'value')
-             ])
-def update_graph(inSimTime, inTargetFlow, inNumRigs, inDrillTime, inWaitFracTime, inFracTime, inWaitPipeTime, inAveFlow, inAveDecline, inGasPrice, inExchangeRate, inCostToDrill, inCostToFrac, inCostToTieIn):
-        params = {
-            'simTime': int(inSimTime),
-            'tgtFlow': float(inTargetFlow),
-            'numRigs': int(inNumRigs),
-            'drillTime': int(inDrillTime),
-            'fracWaitTime': int(inWaitFracTime),
-            'fracTime': int(inFracTime),
-            'pipeWaitTime': int(inWaitPipeTime),
-            'aveFlow': float(inAveFlow),
-            'aveDecline': int(inAveDecline),
-            'gasPrice': float(inGasPrice),
-            'exchangeRate': float(inExchangeRate),
-            'costToDrill': float(inCostToDrill),
-            'costToFrac': float(inCostToFrac),
-            'costToTieIn': float(inCostToTieIn)
-        }
-
-        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = simulateField(params)
+        plan = best['params']
+        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = cachedSimulateField(plan)
+        qX, qY = decimate(tArr, qArr)
+        exposureX, exposureY = decimate(tArr, exposureArr)
 
         return [
         html.Div(className="four columns", children=[
-            dcc.Graph(
-                id='decline-vs-time',
-                figure={
-                    'data': [
-                        go.Scatter(
-                            x=tArr,
-                            y=decArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
-                            name='Gas Production'
-                        )
-                    ],
-                    'layout': go.Layout(
-                        xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Production (scf/day)'},
-                        margin={'l': 60, 'b': 40, 't': 10, 'r': 10},
-                        legend={'x': 0, 'y': 1},
-                        hovermode='closest'
-                    )
-                }
-            )
+            html.P('Number of Rigs: %d' % plan['numRigs']),
+            html.P('Well Drilling Time (Days): %d' % plan['drillTime']),
+            html.P('Rig Stop Time (years): %.2f' % plan['rigStopTime']),
+            html.P('Plateau Production (scf/day): %.4g' % best['plateauFlow']),
+            html.P('Peak Capital Exposure ($): %.4g' % best['peakExposure']),
+            html.P('Plans Evaluated: %d' % result['evaluated'])
         ]),
 
-        html.Div(className="four columns", children=[
+        html.Div(className="eight columns", children=[
             dcc.Graph(
-                id='prod-vs-time',
+                id='opt-prod-vs-time',
                 figure={
                     'data': [
                         go.Scatter(
-                            x=tArr,
-                            y=qArr,
+                            x=qX,
+                            y=qY,
                             mode='lines',
                             opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
                             name='Field Production'
                         ),
                         go.Scatter(
@@ -518,84 +914,20 @@ def update_graph(inSimTime, inTargetFlow, inNumRigs, inDrillTime, inWaitFracTime
                             y=[params['tgtFlow']*947817.12, params['tgtFlow']*947817.12],
                             mode='lines',
                             opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
                             name='Target Production'
                         ),
                         go.Scatter(
-                            x=tArr,
-                            y=numWellArr,
+                            x=exposureX,
+                            y=exposureY,
                             mode='lines',
                             opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Well Count',
-                            yaxis='y2'
-                        )
-                    ],
-                    'layout': go.Layout(
-                        xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Production (scf/day)'},
-                        yaxis2={
-                            'title': 'Well Count',
-                            'overlaying': 'y',
-                            'side': 'right'
-                        },
-                        margin={'l': 60, 'b': 40, 't': 10, 'r': 60},
-                        legend={'x': 0, 'y': 1},
-                        hovermode='closest'
-                    )
-                }
-            )
-        ]),
-
-        html.Div(className="four columns", children=[
-            dcc.Graph(
-                id='cost-vs-time',
-                figure={
-                    'data': [
-                        go.Scatter(
-                            x=tArr,
-                            y=expenseArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'white'}
-                            },
-                            name='Total Expenses'
-                        ),
-                        go.Scatter(
-                            x=tArr,
-                            y=incomeArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
-                            name='Total Income'
-                        ),
-                        go.Scatter(
-                            x=tArr,
-                            y=exposureArr,
-                            mode='lines',
-                            opacity=0.7,
-                            marker={
-                                'size': 15,
-                                'line': {'width': 0.5, 'color': 'red'}
-                            },
                             name='Capital Exposure',
                             yaxis='y2'
                         )
                     ],
                     'layout': go.Layout(
                         xaxis={'title': 'Field Days'},
-                        yaxis={'title': 'Cost ($)'},
+                        yaxis={'title': 'Production (scf/day)'},
                         yaxis2={
                             'title': 'Captial Exposure ($)',
                             'overlaying': 'y',
@@ -611,6 +943,133 @@ def update_graph(inSimTime, inTargetFlow, inNumRigs, inDrillTime, inWaitFracTime
         ]
 
 
+# Callback requests are recorded by gasFieldMetrics when it is enabled
+def beginCallbackMetrics():
+    if flask.request.path.endswith('/_dash-update-component'):
+        body = flask.request.get_json(silent=True) or {}
+        metrics.begin(str(body.get('output', 'callback')))
+
+def endCallbackMetrics(response):
+    metrics.end(status=response.status_code, responseBytes=response.calculate_content_length())
+    return response
+
+def serveMetrics():
+    snapshot = metrics.getSnapshot()
+    snapshot['caches'] = {
+        'simCache': simCache.getStats(),
+        'physicsCache': physicsCache.getStats(),
+        'summaryCache': summaryCache.getStats(),
+        'typeCurveCache': typeCurveCache.getStats(),
+        'planCache': planCache.getStats(),
+        'overlayCache': overlayCache.getStats()
+    }
+    if gasFieldSim.scenarioGrid is not None:
+        snapshot['scenarioGrid'] = gasFieldSim.scenarioGrid.getStats()
+    if gasFieldSim.resultStore is not None:
+        snapshot['resultStore'] = gasFieldSim.resultStore.getStats()
+    return flask.jsonify(snapshot)
+
+
+# App factory: builds the Dash app, its auth and callbacks. Importing this
+# module does neither, so workers and tools only pay for what they use. A
+# precomputed scenario grid (see gasFieldGrid) is mapped from GASFIELD_GRID,
+# interpolating between its points only with GASFIELD_GRID_INTERPOLATE=1,
+# and with GASFIELD_STORE the worker processes of a multi-worker deployment
+# share results and jobs (see gasFieldStore).
+def createApp():
+    gridPath = os.environ.get('GASFIELD_GRID')
+    if gridPath and gasFieldSim.scenarioGrid is None:
+        interpolate = os.environ.get('GASFIELD_GRID_INTERPOLATE', '') not in ('', '0')
+        setScenarioGrid(ScenarioGrid.load(gridPath, interpolate))
+    if gasFieldSim.resultStore is None:
+        setResultStore(storeFromEnvironment())
+        jobQueue.store = gasFieldSim.resultStore
+
+    app = dash.Dash('auth')
+    auth = dash_auth.BasicAuth(
+        app,
+        VALID_UNAME_PWORD_PAIRS
+    )
+
+    #app.css.append_css({"external_url": "https://codepen.io/chriddyp/pen/bWLwgP.css"})
+    app.css.append_css({'external_url': 'https://cdn.rawgit.com/plotly/dash-app-stylesheets/2d266c578d2a6e8850ebce48fdb52759b2aef506/stylesheet-oil-and-gas.css'})
+    #app.css.append_css({"external_url": "https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/css/bootstrap-theme.min.css"})
+
+    app.layout = serveLayout
+
+    if metrics.enabled:
+        app.server.before_request(beginCallbackMetrics)
+        app.server.after_request(endCallbackMetrics)
+    app.server.add_url_rule('/metrics', 'metrics', auth.auth_wrapper(serveMetrics))
+
+    app.callback([dash.dependencies.Output('job-store', 'data'),
+                  dash.dependencies.Output('job-poll', 'disabled'),
+                  dash.dependencies.Output('job-progress', 'children'),
+                  dash.dependencies.Output('sim-params', 'data')],
+                 [dash.dependencies.Input('job-poll', 'n_intervals')] +
+                 [dash.dependencies.Input(inputId, 'value') for inputId, key, cast in PARAM_INPUTS],
+                 [dash.dependencies.State('job-store', 'data')])(update_job)
+
+    app.callback([dash.dependencies.Output('decline-vs-time', 'figure'),
+                  dash.dependencies.Output('decline-vs-time-key', 'data')],
+                 [dash.dependencies.Input('sim-params', 'data'),
+                  dash.dependencies.Input('decline-vs-time', 'relayoutData')],
+                 [dash.dependencies.State('decline-vs-time-key', 'data')])(update_decline_graph)
+
+    app.callback([dash.dependencies.Output('prod-vs-time', 'figure'),
+                  dash.dependencies.Output('prod-vs-time-key', 'data')],
+                 [dash.dependencies.Input('sim-params', 'data'),
+                  dash.dependencies.Input('prod-vs-time', 'relayoutData'),
+                  dash.dependencies.Input('compare-scenarios', 'value')],
+                 [dash.dependencies.State('prod-vs-time-key', 'data'),
+                  dash.dependencies.State('scenario-library', 'data')])(update_prod_graph)
+
+    app.callback([dash.dependencies.Output('cost-vs-time', 'figure'),
+                  dash.dependencies.Output('cost-vs-time-key', 'data')],
+                 [dash.dependencies.Input('sim-params', 'data'),
+                  dash.dependencies.Input('cost-vs-time', 'relayoutData'),
+                  dash.dependencies.Input('compare-scenarios', 'value')],
+                 [dash.dependencies.State('cost-vs-time-key', 'data'),
+                  dash.dependencies.State('scenario-library', 'data')])(update_cost_graph)
+
+    app.callback([dash.dependencies.Output('scenario-library', 'data'),
+                  dash.dependencies.Output('compare-scenarios', 'value')],
+                 [dash.dependencies.Input('scenarioSave', 'n_clicks')],
+                 [dash.dependencies.State('inScenarioName', 'value'),
+                  dash.dependencies.State('scenario-library', 'data'),
+                  dash.dependencies.State('compare-scenarios', 'value')] +
+                 [dash.dependencies.State(inputId, 'value') for inputId, key, cast in PARAM_INPUTS])(update_library)
+
+    app.callback(dash.dependencies.Output('compare-scenarios', 'options'),
+                 [dash.dependencies.Input('scenario-library', 'data')])(update_library_options)
+
+    app.callback(dash.dependencies.Output('field-summary', 'children'),
+                 [dash.dependencies.Input('sim-params', 'data')])(update_summary)
+
+    app.callback(dash.dependencies.Output('mc-graphs', component_property='children'),
+                 [dash.dependencies.Input('mcRun', 'n_clicks')],
+                 [dash.dependencies.State('inMcSamples', 'value'),
+                  dash.dependencies.State('inMcSpread', 'value')] +
+                 [dash.dependencies.State(inputId, 'value') for inputId, key, cast in PARAM_INPUTS])(update_mc_graph)
+
+    app.callback(dash.dependencies.Output('sens-graphs', component_property='children'),
+                 [dash.dependencies.Input('sensRun', 'n_clicks')],
+                 [dash.dependencies.State('inSensSpread', 'value'),
+                  dash.dependencies.State('inDiscountRate', 'value')] +
+                 [dash.dependencies.State(inputId, 'value') for inputId, key, cast in PARAM_INPUTS])(update_sens_graph)
+
+    app.callback(dash.dependencies.Output('opt-results', component_property='children'),
+                 [dash.dependencies.Input('optRun', 'n_clicks')],
+                 [dash.dependencies.State('inPlateauTime', 'value'),
+                  dash.dependencies.State('inMaxRigs', 'value')] +
+                 [dash.dependencies.State(inputId, 'value') for inputId, key, cast in PARAM_INPUTS])(update_opt_results)
+
+    return app
+
+# WSGI entry point, e.g. gunicorn 'gasFieldApp:createServer()'
+def createServer():
+    return createApp().server
+
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    createApp().run_server(debug=True)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Headless batch runs of simulateField, without the web app.
+#
+#   python gasFieldBatch.py scenarios.json -o results.parquet
+#   python gasFieldBatch.py plans.jsonl -o results.npz --workers 8
+#
+# A scenario file is a JSON params dict, a JSON list of them, or JSON lines
+# with one per line. Keys left out take their value from DEFAULT_PARAMS.
+# Scenarios with a 'priceSchedule' of (day, gasPrice) pairs run on the
+# event-driven engine, which prices gas by day (exponential decline only).
+#
+# Output is columnar, by file extension or --format:
+#   parquet / arrow - one long table with a 'scenario' column (needs pyarrow)
+#   npz             - compressed NumPy arrays named '<scenario>/<series>'
+# Each scenario's params are kept as JSON, in '<output>.params.json' for tables
+# and in the 'params' array for npz. decArr is shorter than the other series,
+# so in tables it is padded with NaN at the end.
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gasFieldSim import DEFAULT_PARAMS, simulateField, simulateFieldEvents
+
+
+SERIES_NAMES = ('tArr', 'qArr', 'expenseArr', 'incomeArr', 'decArr', 'exposureArr', 'numWellArr')
+FORMATS = ('parquet', 'arrow', 'npz')
+
+
+def loadScenarios(path):
+    with open(path) as f:
+        if path.endswith('.jsonl'):
+            scenarios = [json.loads(line) for line in f if line.strip()]
+        else:
+            scenarios = json.load(f)
+    if isinstance(scenarios, dict):
+        scenarios = [scenarios]
+    return [dict(DEFAULT_PARAMS, **scenario) for scenario in scenarios]
+
+def simulateColumns(params):
+    if 'priceSchedule' in params:
+        return dict(zip(SERIES_NAMES, simulateFieldEvents(params)))
+    return dict(zip(SERIES_NAMES, simulateField(params)))
+
+# Yields (params, columns) for each scenario, in order, as results come back
+def iterScenarios(scenarios, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(scenarios) <= 1:
+        for params in scenarios:
+            yield params, simulateColumns(params)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(scenarios))) as pool:
+        for params, columns in zip(scenarios, pool.map(simulateColumns, scenarios)):
+            yield params, columns
+
+def runScenarios(scenarios, workers=None):
+    return [columns for params, columns in iterScenarios(scenarios, workers)]
+
+
+def scenarioTable(index, columns):
+    import pyarrow as pa
+
+    numDays = len(columns['tArr'])
+    decArr = np.full(numDays, np.nan)
+    decArr[:len(columns['decArr'])] = columns['decArr']
+    table = {'scenario': np.full(numDays, index, dtype=np.int32)}
+    for name in SERIES_NAMES:
+        table[name] = decArr if name == 'decArr' else np.asarray(columns[name])
+    return pa.table(table)
+
+def writeTable(path, results, fileFormat):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('pyarrow is required for %s output; use npz instead' % fileFormat)
+
+    writer = None
+    allParams = []
+    try:
+        for index, (params, columns) in enumerate(results):
+            table = scenarioTable(index, columns)
+            if writer is None:
+                if fileFormat == 'parquet':
+                    writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+                else:
+                    writer = pa.ipc.new_file(path, table.schema)
+            writer.write_table(table)
+            allParams.append(params)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # params are only all known once the table is written, so they go in a sidecar file
+    with open(path + '.params.json', 'w') as f:
+        json.dump(allParams, f, indent=1)
+    return len(allParams)
+
+def writeNpz(path, results):
+    arrays = {}
+    allParams = []
+    for index, (params, columns) in enumerate(results):
+        for name in SERIES_NAMES:
+            arrays['%d/%s' % (index, name)] = np.asarray(columns[name])
+        allParams.append(params)
+    arrays['params'] = np.array(json.dumps(allParams))
+    np.savez_compressed(path, **arrays)
+    return len(allParams)
+
+def writeResults(path, results, fileFormat=None):
+    fileFormat = fileFormat or os.path.splitext(path)[1].lstrip('.')
+    if fileFormat in ('feather', 'ipc'):
+        fileFormat = 'arrow'
+    if fileFormat not in FORMATS:
+        raise ValueError('Unknown output format: %s' % fileFormat)
+    if fileFormat == 'npz':
+        return writeNpz(path, results)
+    return writeTable(path, results, fileFormat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run gas field scenarios without the web app')
+    parser.add_argument('scenarios', nargs='+', help='JSON or JSON lines files of params dicts')
+    parser.add_argument('-o', '--output', required=True, help='output file (.parquet, .arrow or .npz)')
+    parser.add_argument('--format', choices=FORMATS, help='output format (default: from the output extension)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    scenarios = []
+    for path in args.scenarios:
+        scenarios.extend(loadScenarios(path))
+
+    count = writeResults(args.output, iterScenarios(scenarios, args.workers), args.format)
+    print('Wrote %d scenarios to %s' % (count, args.output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# Precomputed scenario grid, so scenarios near the usual ones need no simulation.
+#
+#   python gasFieldGrid.py -o grid.npy
+#   python gasFieldGrid.py -o grid.npy --axis drillTime=20:60:5 --axis aveDecline=2:8:1 --sim-time 50
+#   GASFIELD_GRID=grid.npy python gasFieldApp.py
+#   GASFIELD_GRID=grid.npy GASFIELD_GRID_INTERPOLATE=1 python gasFieldApp.py
+#
+# Production scales exactly with numRigs and aveFlow, and a shorter
+# simulation is the start of a longer one, so the grid only stores the field
+# production of one rig of unit wells for the longest simTime, at every
+# combination of the axes (by default drillTime and aveDecline). Other
+# physical params are fixed at the grid's base scenario and economics are
+# priced live. Production is stored as float32 in a .npy file, with the axes
+# and base scenario in '<grid>.json', and is memory-mapped read-only on load.
+#
+# A scenario is on the grid when its fixed params match the base, it has no
+# rigStopTime before simTime, no flowSpread and fits in the grid's simTime,
+# and every axis hits a grid value; lookups there match the simulation to
+# float32 precision. Grids loaded with interpolate=True also take
+# INTERPOLATED_KEYS between grid values, interpolating linearly. That is
+# approximate: on the default grid production is off by up to about 1% (at
+# aveDecline 2.5) and final exposure by up to about 9%, which feeds straight
+# into the NPV and IRR of the summary, so it is off unless asked for.
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gasFieldSim import (DEFAULT_PARAMS, PHYSICAL_PARAM_KEYS, FieldTimeline, declineParams, paramsKey, rigStopTime,
+                         simulatePhysics, spudSchedule, typeCurve, wellsOfAge)
+
+
+DEFAULT_AXES = {
+    'drillTime': list(range(20, 65, 5)),
+    'aveDecline': list(range(2, 9))
+}
+DEFAULT_SIM_TIME = 50 # years
+
+# Axes whose production varies smoothly enough to interpolate
+INTERPOLATED_KEYS = ('aveDecline', 'bFactor', 'terminalDecline')
+
+# Params applied on lookup rather than stored on the grid
+SCALED_KEYS = ('simTime', 'numRigs', 'aveFlow', 'rigStopTime')
+
+
+def gridBaseKeys(axes):
+    return tuple(key for key in PHYSICAL_PARAM_KEYS if key not in SCALED_KEYS and key not in axes)
+
+# Worker for buildGrid: production of one rig of unit wells
+def simulateUnit(params):
+    return simulatePhysics(params).qArr
+
+# Simulates every point of the grid and writes it to path, with its metadata
+# alongside; returns the number of points
+def buildGrid(path, axes=None, base=None, simTime=DEFAULT_SIM_TIME, workers=None, dtype='float32'):
+    axes = {key: sorted(values) for key, values in (axes or DEFAULT_AXES).items()}
+    base = dict(DEFAULT_PARAMS, **(base or {}))
+    base.pop('rigStopTime', None)
+    names = sorted(axes)
+    points = [dict(base, simTime=simTime, numRigs=1, aveFlow=1.0, **dict(zip(names, values)))
+              for values in itertools.product(*(axes[name] for name in names))]
+
+    numDays = int(math.floor(simTime*365.0)) + 1
+    shape = tuple(len(axes[name]) for name in names) + (numDays,)
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    rows = table.reshape(-1, numDays)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(points) <= 1:
+        results = map(simulateUnit, points)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(points)))
+        results = pool.map(simulateUnit, points, chunksize=max(len(points)//(4*workers), 1))
+    try:
+        for i, qArr in enumerate(results):
+            rows[i] = qArr
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    table.flush()
+    del rows, table
+
+    with open(path + '.json', 'w') as f:
+        json.dump({
+            'axes': {name: axes[name] for name in names},
+            'base': dict(paramsKey(base, gridBaseKeys(axes))),
+            'simTime': simTime,
+            'numDays': numDays
+        }, f, indent=1)
+    return len(points)
+
+
+class ScenarioGrid(object):
+
+    def __init__(self, table, axes, base, numDays, interpolate=False):
+        self.table = table
+        self.interpolate = interpolate
+        self.names = sorted(axes)
+        self.axes = {name: np.asarray(axes[name], dtype=float) for name in self.names}
+        self.base = base
+        self.baseKeys = tuple(sorted(base))
+        self.numDays = numDays
+        self.lookups = 0
+        self.hits = 0
+
+    # Maps the grid file without reading it; pages are loaded as lookups touch them
+    @classmethod
+    def load(cls, path, interpolate=False):
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        table = np.load(path, mmap_mode='r')
+        return cls(table, meta['axes'], meta['base'], meta['numDays'], interpolate)
+
+    # Grid cells around params as ((index, ...), weight) pairs, or None off the grid
+    def corners(self, params):
+        if declineParams(params)['flowSpread'] > 0:
+            return None
+        t_fin = params['simTime']*365.0
+        if t_fin < 0 or int(math.floor(t_fin)) + 1 > self.numDays or rigStopTime(params) < params['simTime']:
+            return None
+        if dict(paramsKey(params, self.baseKeys)) != self.base:
+            return None
+        params = dict(params, **declineParams(params))
+
+        axisCorners = []
+        for name in self.names:
+            values = self.axes[name]
+            value = float(params[name])
+            i = int(np.searchsorted(values, value))
+            if i < len(values) and abs(values[i] - value) < 1.0E-9:
+                axisCorners.append([(i, 1.0)])
+            elif self.interpolate and name in INTERPOLATED_KEYS and 0 < i < len(values):
+                fraction = (value - values[i - 1])/(values[i] - values[i - 1])
+                axisCorners.append([(i - 1, 1.0 - fraction), (i, fraction)])
+            else:
+                return None
+
+        corners = []
+        for combination in itertools.product(*axisCorners):
+            index = tuple(i for i, weight in combination)
+            weight = float(np.prod([weight for i, weight in combination]))
+            corners.append((index, weight))
+        return corners
+
+    def covers(self, params):
+        return self.corners(params) is not None
+
+    # FieldTimeline of params from the grid, or None when they are off it
+    def lookup(self, params):
+        self.lookups += 1
+        corners = self.corners(params)
+        if corners is None:
+            return None
+        self.hits += 1
+
+        # well construction parameters
+        drillTime = int(params['drillTime']) # days
+        fracDoneTime = drillTime + int(params['fracWaitTime']) + int(params['fracTime']) # days
+        totalNonFlowTime = fracDoneTime + int(params['pipeWaitTime']) # days
+
+        rigsOperating = max(int(params['numRigs']), 0)
+        aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
+        numDays = int(math.floor(params['simTime']*365.0)) + 1
+        tArr = np.arange(numDays)
+
+        qArr = np.zeros(numDays)
+        for index, weight in corners:
+            qArr += weight*self.table[index][:numDays]
+        qArr *= rigsOperating*params['aveFlow']
+
+        spudDays = spudSchedule(drillTime, numDays, rigStopTime(params)*365.0)
+        cumSpud = np.cumsum(rigsOperating*np.bincount(spudDays, minlength=numDays).astype(float))
+
+        # decline of the first well, from its first flowing day
+        if rigsOperating > 0:
+            table = typeCurve(params, numDays - min(totalNonFlowTime, 0))
+            decArr = aveMaxFlow*table[1:max(numDays - totalNonFlowTime, 1)]
+        else:
+            decArr = np.zeros(0)
+
+        return FieldTimeline(tArr, qArr, decArr, np.rint(cumSpud).astype(int),
+                             wellsOfAge(cumSpud, drillTime),
+                             wellsOfAge(cumSpud, fracDoneTime),
+                             wellsOfAge(cumSpud, totalNonFlowTime))
+
+    def getStats(self):
+        return {'lookups': self.lookups, 'hits': self.hits, 'points': int(np.prod(self.table.shape[:-1])),
+                'numDays': self.numDays, 'bytes': int(self.table.nbytes), 'interpolate': self.interpolate}
+
+
+def parseAxis(text):
+    name, values = text.split('=', 1)
+    if ':' in values:
+        start, stop, step = (float(value) for value in values.split(':'))
+        values = [float(value) for value in np.arange(start, stop + 0.5*step, step)]
+    else:
+        values = [float(value) for value in values.split(',')]
+    if name in ('drillTime', 'fracWaitTime', 'fracTime', 'pipeWaitTime'):
+        values = [int(round(value)) for value in values]
+    return name, values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute a grid of gas field scenarios for the web app')
+    parser.add_argument('-o', '--output', required=True, help='grid file (.npy); metadata goes to <output>.json')
+    parser.add_argument('--axis', action='append', type=parseAxis,
+                        help='NAME=START:STOP:STEP or NAME=V1,V2,... (default: drillTime and aveDecline)')
+    parser.add_argument('--base', help='JSON params file of the fixed params (default: DEFAULT_PARAMS)')
+    parser.add_argument('--sim-time', type=float, default=DEFAULT_SIM_TIME, help='longest simTime covered (years)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    axes = dict(args.axis) if args.axis else None
+    base = None
+    if args.base:
+        with open(args.base) as f:
+            base = json.load(f)
+    for name in axes or ():
+        if name in SCALED_KEYS:
+            parser.error('%s is applied on lookup and cannot be a grid axis' % name)
+
+    count = buildGrid(args.output, axes, base, args.sim_time, args.workers)
+    print('Wrote %d grid points to %s' % (count, args.output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from gasFieldMetrics import metrics
+from gasFieldSim import cachedSimulateField, inResultStore, onScenarioGrid, paramsKey, simCache
+
+
+# Setup of Background Jobs
+
+JOB_STATUSES = ('queued', 'running', 'done', 'cancelled', 'failed')
+
+
+class SimulationJob(object):
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = 'queued'
+        self.progress = 0.0
+        self.error = None
+        self.seconds = None
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.status == 'queued':
+            self.status = 'cancelled'
+
+    def isFinished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+
+# Runs simulations on a small thread pool so callbacks return straight away.
+# A job runs the vectorized engine in one go: streaming the scenario with
+# iterSimulateField would report progress, but costs many times the
+# simulation it reports on. A job cancelled before it starts is not run.
+# Finished results go into the simulation caches, where the figure callbacks
+# pick them up.
+# Only the latest maxJobs jobs are remembered. With a shared store (a
+# gasFieldStore.ResultStore) job status is published there as well, so
+# other worker processes can poll and cancel the jobs this one runs.
+class JobQueue(object):
+
+    def __init__(self, workers=2, maxJobs=256, store=None):
+        self.maxJobs = maxJobs
+        self.store = store
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Submits params, cancelling the job they replace. Scenarios already in
+    # the cache, on the scenario grid or in the shared store come back as
+    # finished jobs without touching the pool.
+    def submit(self, params, replaces=None):
+        if replaces is not None:
+            self.cancel(replaces)
+
+        job = SimulationJob(params)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.maxJobs:
+                self.jobs.popitem(last=False)
+
+        if paramsKey(params) in simCache or onScenarioGrid(params) or inResultStore(params):
+            cachedSimulateField(params)
+            job.status = 'done'
+            job.progress = 1.0
+            self.publish(job)
+        else:
+            self.publish(job)
+            self.pool.submit(self.run, job)
+        return job
+
+    def publish(self, job):
+        if self.store is not None:
+            self.store.putJob(job.id, job.status, job.progress, job.error, job.params)
+
+    # The job, or a snapshot of its published status when another worker runs it
+    def get(self, jobId):
+        with self.lock:
+            job = self.jobs.get(jobId)
+        if job is None and self.store is not None:
+            published = self.store.getJob(jobId)
+            if published is not None:
+                job = SimulationJob(published['params'])
+                job.id = jobId
+                job.status = published['status']
+                job.progress = published['progress']
+                job.error = published['error']
+        return job
+
+    # Whether the job is still known and running, or finished successfully
+    def isLive(self, jobId):
+        job = self.get(jobId)
+        return job is not None and job.status in ('queued', 'running', 'done')
+
+    def cancel(self, jobId):
+        job = self.get(jobId)
+        if job is not None and not job.isFinished():
+            job.cancel()
+            if self.store is not None:
+                self.store.cancelJob(jobId)
+
+    def isCancelled(self, job):
+        return job.cancelled.is_set() or (self.store is not None and self.store.isJobCancelled(job.id))
+
+    def run(self, job):
+        try:
+            self.runJob(job)
+        finally:
+            self.publish(job)
+
+    def runJob(self, job):
+        if self.isCancelled(job):
+            job.status = 'cancelled'
+            return
+        job.status = 'running'
+        self.publish(job)
+        start = time.perf_counter()
+        # jobs run off the request threads, so they are recorded on their own
+        metrics.begin('job')
+        try:
+            with metrics.stage('simulate'):
+                cachedSimulateField(job.params)
+            job.seconds = time.perf_counter() - start
+            job.progress = 1.0
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            metrics.end(jobId=job.id, jobStatus=job.status)
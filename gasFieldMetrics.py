@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Instrumentation of the dashboard callbacks. Off unless enabled:
+#
+#   GASFIELD_METRICS=1 python gasFieldApp.py
+#   GASFIELD_METRICS=1 GASFIELD_PROFILE_DIR=/tmp/profiles python gasFieldApp.py
+#
+# Each callback request gets a record of the time spent in each stage
+# (simulation, figure building, ...), notes such as well counts, series
+# lengths and cache outcomes, and the request's total time and response size.
+# What is left of the total after the stages is Dash dispatch and JSON
+# serialization. Background simulation jobs get a record of their own, named
+# 'job'. The app serves recent records and per-stage totals as JSON at
+# /metrics. With GASFIELD_PROFILE_DIR set, a GASFIELD_PROFILE_RATE fraction
+# of requests and jobs (all by default) also run under cProfile, with the
+# stats dumped there one file per record. Only one profile runs at a time,
+# as Python 3.12 allows a single active profiler, so records starting while
+# another is profiled are not sampled.
+import cProfile
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+
+NULL_STAGE = contextlib.nullcontext()
+
+
+class Metrics(object):
+
+    def __init__(self, enabled=False, maxRecords=500, profileDir=None, profileRate=1.0):
+        self.enabled = enabled
+        self.profileDir = profileDir
+        self.profileRate = profileRate
+        self.records = deque(maxlen=maxRecords)
+        self.stageTotals = {}
+        self.requests = 0
+        self.profiled = 0
+        self.profiling = False
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def current(self):
+        return getattr(self.local, 'record', None)
+
+    # Starts the record of a request on this thread
+    def begin(self, name):
+        if not self.enabled:
+            return
+        record = {'name': name, 'start': time.time(), 'stages': {}, 'notes': {}}
+        self.local.record = record
+        self.local.started = time.perf_counter()
+        self.local.profile = None
+        if self.profileDir is not None:
+            with self.lock:
+                self.requests += 1
+                sampled = int(self.requests*self.profileRate) > int((self.requests - 1)*self.profileRate)
+                sampled = sampled and not self.profiling
+                self.profiling = self.profiling or sampled
+            if sampled:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiler, outside these metrics, is active
+                    with self.lock:
+                        self.profiling = False
+                    return
+                self.local.profile = profile
+
+    # Times the body of a with block as stage name of the current record;
+    # does nothing outside a request or when disabled
+    def stage(self, name):
+        if not self.enabled or self.current() is None:
+            return NULL_STAGE
+        return self.timedStage(name)
+
+    @contextlib.contextmanager
+    def timedStage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self.current()['stages']
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def note(self, **notes):
+        record = self.current() if self.enabled else None
+        if record is not None:
+            record['notes'].update(notes)
+
+    # Finishes the current record with the request's totals
+    def end(self, **notes):
+        record = self.current() if self.enabled else None
+        if record is None:
+            return
+        self.local.record = None
+        record['notes'].update(notes)
+        record['seconds'] = time.perf_counter() - self.local.started
+        record['otherSeconds'] = record['seconds'] - sum(record['stages'].values())
+
+        profile = self.local.profile
+        if profile is not None:
+            profile.disable()
+            with self.lock:
+                self.profiling = False
+            os.makedirs(self.profileDir, exist_ok=True)
+            path = os.path.join(self.profileDir, '%d-%s.prof' % (int(record['start']*1000), record['name'].strip('.').replace('...', '+')))
+            profile.dump_stats(path)
+            record['profile'] = path
+
+        with self.lock:
+            self.records.append(record)
+            for name, seconds in list(record['stages'].items()) + [('total', record['seconds'])]:
+                totals = self.stageTotals.setdefault(name, {'count': 0, 'seconds': 0.0, 'maxSeconds': 0.0})
+                totals['count'] += 1
+                totals['seconds'] += seconds
+                totals['maxSeconds'] = max(totals['maxSeconds'], seconds)
+            if profile is not None:
+                self.profiled += 1
+
+    def getSnapshot(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'profileDir': self.profileDir,
+                'profiled': self.profiled,
+                'stages': {name: dict(totals) for name, totals in self.stageTotals.items()},
+                'records': list(self.records)
+            }
+
+
+def metricsFromEnvironment(environ=os.environ):
+    return Metrics(
+        enabled=environ.get('GASFIELD_METRICS', '') not in ('', '0'),
+        profileDir=environ.get('GASFIELD_PROFILE_DIR') or None,
+        profileRate=float(environ.get('GASFIELD_PROFILE_RATE', 1.0))
+    )
+
+metrics = metricsFromEnvironment()
@@ -0,0 +1,1304 @@
+# -*- coding: utf-8 -*-
+import heapq
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+#from numba import jit
+import numpy as np
+
+
+# Setup of Classes
+
+WELL_STATUSES = ('Drilling', 'Waiting on Frac', 'Fracking', 'Waiting on Pipe', 'Flowing')
+
+# Struct-of-arrays fleet of wells sharing one construction schedule and decline
+# (exponential with declineParam, or a unit typeCurve indexed by days on
+# production); each well has its own peak flow. Per-well state lives in
+# preallocated arrays that double in size as wells are added; a well's
+# production history is recomputed from its spud day.
+class WellFleet(object):
+
+    def __init__(self, drillTime, fracWaitTime, fracTime, pipeWaitTime, declineParam, capacity=64, typeCurve=None):
+        # first age of each status after 'Drilling'; wells flow from the day after tie-in
+        self.stageAges = np.cumsum([drillTime, fracWaitTime, fracTime, pipeWaitTime + 1])
+        self.declineParam = declineParam
+        self.typeCurve = typeCurve
+        self.numWells = 0
+        self.spudDay = np.zeros(capacity, dtype=int)
+        self.age = np.zeros(capacity, dtype=int)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.maxFlowRate = np.zeros(capacity)
+        self.flowRate = np.zeros(capacity)
+
+    def __len__(self):
+        return self.numWells
+
+    def addWells(self, count, maxFlowRate, day=0):
+        count = max(count, 0)
+        numWells = self.numWells + count
+        if numWells > len(self.age):
+            capacity = max(numWells, 2*len(self.age))
+            for name in ('spudDay', 'age', 'status', 'maxFlowRate', 'flowRate'):
+                old = getattr(self, name)
+                new = np.zeros(capacity, dtype=old.dtype)
+                new[:self.numWells] = old[:self.numWells]
+                setattr(self, name, new)
+
+        added = slice(self.numWells, numWells)
+        self.spudDay[added] = day
+        self.age[added] = 0
+        self.maxFlowRate[added] = maxFlowRate
+        self.numWells = numWells
+        self.updateWells(added)
+
+    def updateWells(self, wells):
+        age = self.age[wells]
+        self.status[wells] = np.searchsorted(self.stageAges, age, side='right')
+        timeFlowing = age - (self.stageAges[-1] - 1)
+        self.flowRate[wells] = self.wellFlow(self.maxFlowRate[wells], timeFlowing)
+
+    # Flow of wells timeFlowing days on production: exponential decline, or
+    # gathered from a unit type curve when the fleet has one
+    def wellFlow(self, maxFlowRate, timeFlowing):
+        timeFlowing = np.maximum(timeFlowing, 0)
+        if self.typeCurve is None:
+            flow = decline(maxFlowRate, self.declineParam, timeFlowing)
+        else:
+            flow = maxFlowRate*self.typeCurve[np.minimum(timeFlowing, len(self.typeCurve) - 1)]
+        return np.where(timeFlowing > 0, flow, 0.0)
+
+    # Ages every well by days
+    def step(self, days=1):
+        wells = slice(0, self.numWells)
+        self.age[wells] += days
+        self.updateWells(wells)
+
+    def getAge(self):
+        return self.age[:self.numWells]
+
+    def getStatus(self, index):
+        return WELL_STATUSES[self.status[index]]
+
+    def getFlowRates(self):
+        return self.flowRate[:self.numWells]
+
+    def getFlow(self):
+        return float(self.flowRate[:self.numWells].sum())
+
+    # Flow rate of one well on each of the first numDays field days
+    def getHistory(self, index, numDays):
+        timeFlowing = np.arange(numDays) - self.spudDay[index] - (self.stageAges[-1] - 1)
+        return self.wellFlow(self.maxFlowRate[index], timeFlowing)
+
+
+# A named field. params holds its reservoir, construction and economic
+# parameters (as in DEFAULT_PARAMS) when it is part of a portfolio, plus an
+# optional 'maxWells' limit on how many wells the rigs may drill there.
+class Field(object):
+
+    def __init__(self, name, wells=None, params=None):
+        self.name = name
+        self.wells = wells
+        self.params = params
+        self.numWells = 0
+        self.flowRate = 0
+
+    def getFlow(self):
+        if self.wells is None:
+            return 0.0
+        return self.wells.getFlow()
+
+
+# Setup of Functions
+
+# Decline curve
+def decline(qi, d, t):
+    return qi*np.exp(-d*t)
+
+# Decline models, selected by params['declineModel']:
+#   'exponential'        - q = qi*exp(-D*t)
+#   'hyperbolic'         - Arps, q = qi/(1 + b*D*t)**(1/b) with params['bFactor']
+#   'harmonic'           - Arps with b = 1, q = qi/(1 + D*t)
+#   'modifiedHyperbolic' - hyperbolic until its decline rate falls to
+#                          params['terminalDecline'] (%/year), exponential after
+# D is set so a well is down to 10% of qi after params['aveDecline'] years
+# (for modifiedHyperbolic, the hyperbolic part). Per-well peak flows are
+# lognormal about aveFlow with sigma params['flowSpread'], drawn from
+# params['wellSeed']; the default of 0 makes every well the type well.
+DECLINE_MODELS = ('exponential', 'hyperbolic', 'harmonic', 'modifiedHyperbolic')
+DECLINE_DEFAULTS = {'declineModel': 'exponential', 'bFactor': 0.5, 'terminalDecline': 5.0, 'flowSpread': 0.0, 'wellSeed': 0}
+
+def declineParams(params):
+    return dict(DECLINE_DEFAULTS, **{key: params[key] for key in DECLINE_DEFAULTS if key in params})
+
+# Initial decline rate d (1/day), b factor, and the time and unit flow at
+# which a modified hyperbolic decline turns exponential at terminalDecline
+# (infinite for the other models)
+def declineCoefficients(model, declineTime, bFactor, terminalDecline):
+    if model not in DECLINE_MODELS:
+        raise ValueError('Unknown decline model: %s' % model)
+    if model == 'exponential':
+        return 2.30259/declineTime, 0.0, math.inf, 0.0
+    if model == 'harmonic':
+        return 9.0/declineTime, 1.0, math.inf, 0.0
+
+    b = max(float(bFactor), 1.0E-6)
+    d = (10.0**b - 1.0)/(b*declineTime)
+    dLim = terminalDecline/100.0/365.0
+    if model == 'modifiedHyperbolic' and 0.0 < dLim < d:
+        tSwitch = (d/dLim - 1.0)/(b*d)
+        return d, b, tSwitch, (1.0 + b*d*tSwitch)**(-1.0/b)
+    return d, b, math.inf, 0.0
+
+# Flow of a unit well (qi = 1) t days on production
+def declineRate(model, declineTime, bFactor, terminalDecline, t):
+    t = np.asarray(t, dtype=float)
+    d, b, tSwitch, qSwitch = declineCoefficients(model, declineTime, bFactor, terminalDecline)
+    if b == 0.0:
+        return np.exp(-d*t)
+    q = 1.0/(1.0 + d*t) if b == 1.0 else (1.0 + b*d*t)**(-1.0/b)
+    if tSwitch < math.inf:
+        dLim = terminalDecline/100.0/365.0
+        q = np.where(t > tSwitch, qSwitch*np.exp(-dLim*(t - tSwitch)), q)
+    return q
+
+# Type-curve table of the params' decline model, computed once per model and
+# length and shared read-only, so simulations gather flows from it instead
+# of evaluating the model for every well and day
+def typeCurve(params, numDays):
+    curveParams = declineParams(params)
+    key = (curveParams['declineModel'], float(params['aveDecline']), float(curveParams['bFactor']),
+           float(curveParams['terminalDecline']), int(numDays))
+    table = typeCurveCache.get(key)
+    if table is None:
+        table = declineRate(curveParams['declineModel'], params['aveDecline']*365.0, curveParams['bFactor'],
+                            curveParams['terminalDecline'], np.arange(max(int(numDays), 1)))
+        table.flags.writeable = False
+        typeCurveCache.put(key, table)
+    return table
+
+# Sum of the per-well peak flow multipliers of the wells spudded each day
+# (equal to spudCount without flowSpread). Wells draw in spud order, so the
+# same wells get the same multipliers whichever engine simulates them.
+def wellFlowWeights(params, spudCount):
+    spread = float(declineParams(params)['flowSpread'])
+    if spread <= 0.0:
+        return spudCount
+    counts = np.rint(spudCount).astype(int)
+    numWells = int(counts.sum())
+    if numWells == 0:
+        return np.zeros(len(spudCount))
+    rng = np.random.default_rng(int(declineParams(params)['wellSeed']))
+    multipliers = rng.lognormal(-0.5*spread**2, spread, numWells)
+    days = np.flatnonzero(counts)
+    weights = np.zeros(len(spudCount))
+    weights[days] = np.add.reduceat(multipliers, np.concatenate(([0], np.cumsum(counts[days])[:-1])))
+    return weights
+
+# Years after which the rigs stop spudding new wells; by default they drill for the whole simulation
+def rigStopTime(params):
+    return min(params.get('rigStopTime', params['simTime']), params['simTime'])
+
+# Days from firstDay to numDays - 1 on which a new cohort of wells is spudded (one well per rig)
+def spudSchedule(drillTime, numDays, stopDay=None, firstDay=0):
+    if numDays <= max(firstDay, 0):
+        return np.zeros(0, dtype=int)
+    spudDays = np.arange(max(-(-firstDay//drillTime), 1)*drillTime, numDays, drillTime)
+    if stopDay is not None:
+        spudDays = spudDays[spudDays <= stopDay]
+    return np.concatenate(([0] if firstDay <= 0 else [], spudDays[spudDays > 1])).astype(int)
+
+# Number of wells at least `age` days old on each day, from the cumulative spud count
+def wellsOfAge(cumSpud, age):
+    numDays = len(cumSpud)
+    wells = np.zeros(numDays)
+    if 0 <= age < numDays:
+        wells[age:] = cumSpud[:numDays - age]
+    return wells
+
+# Sum of a type-well curve started on every spud day
+def superpose(spudCount, curve, mode):
+    numDays = len(spudCount)
+    if mode == 'convolution':
+        n = 1 << max(2*numDays - 1, 1).bit_length()
+        return np.fft.irfft(np.fft.rfft(spudCount, n)*np.fft.rfft(curve, n), n)[:numDays]
+
+    total = np.zeros(numDays)
+    for spudDay in np.flatnonzero(spudCount):
+        total[spudDay:] += spudCount[spudDay]*curve[:numDays - spudDay]
+    return total
+
+# Physical side of a simulation: production and when wells reach each costed event
+class FieldTimeline(object):
+
+    def __init__(self, tArr, qArr, decArr, numWellArr, drilledArr, frackedArr, tiedInArr):
+        self.tArr = tArr
+        self.qArr = qArr
+        self.cumQArr = np.cumsum(qArr)
+        self.decArr = decArr
+        self.numWellArr = numWellArr
+        self.drilledArr = drilledArr
+        self.frackedArr = frackedArr
+        self.tiedInArr = tiedInArr
+
+    def arrays(self):
+        return (self.tArr, self.qArr, self.cumQArr, self.decArr, self.numWellArr,
+                self.drilledArr, self.frackedArr, self.tiedInArr)
+
+
+# Vectorized physical simulation
+# Every well follows the same type-well curve, so the field is the sum of
+# that curve shifted to each cohort's spud day. mode selects how the sum is
+# taken: 'cohort' adds one shifted curve per cohort, 'convolution' convolves
+# the spud schedule with the type well by FFT, and 'auto' picks convolution
+# once there are more than CONVOLUTION_MIN_COHORTS cohorts.
+SIM_MODES = ('auto', 'cohort', 'convolution')
+CONVOLUTION_MIN_COHORTS = 32
+
+def simulatePhysics(params, mode='auto'):
+    # field construction parameters
+    drillTime = int(params['drillTime']) # days
+    rigsOperating = max(int(params['numRigs']), 0)
+
+    # simulation parameters
+    t_fin = params['simTime']*365.0
+    numDays = int(math.floor(t_fin)) + 1 if t_fin >= 0 else 0
+
+    # drilling schedule
+    spudDays = spudSchedule(drillTime, numDays, rigStopTime(params)*365.0)
+    spudCount = rigsOperating*np.bincount(spudDays, minlength=numDays).astype(float)
+
+    return scheduledPhysics(params, spudCount, mode)
+
+# Physical simulation of a field from the number of wells spudded on each
+# day, however they were scheduled; the simulation runs for len(spudCount) days
+def scheduledPhysics(params, spudCount, mode='auto'):
+    if mode not in SIM_MODES:
+        raise ValueError('Unknown simulation mode: %s' % mode)
+
+    # reservoir parameters
+    aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
+
+    # well construction parameters
+    drillTime = int(params['drillTime']) # days
+    fracDoneTime = drillTime + int(params['fracWaitTime']) + int(params['fracTime']) # days
+    totalNonFlowTime = fracDoneTime + int(params['pipeWaitTime']) # days
+
+    numDays = len(spudCount)
+    tArr = np.arange(numDays)
+
+    # type well, indexed by well age in days, gathered from the type curve
+    timeFlowing = tArr - totalNonFlowTime
+    table = typeCurve(params, numDays - min(totalNonFlowTime, 0))
+    typeFlow = np.where(timeFlowing > 0, aveMaxFlow*table[np.maximum(timeFlowing, 0)], 0.0)
+
+    spudDays = np.flatnonzero(spudCount)
+    cumSpud = np.cumsum(spudCount)
+
+    if mode == 'auto':
+        mode = 'convolution' if len(spudDays) > CONVOLUTION_MIN_COHORTS else 'cohort'
+
+    qArr = superpose(wellFlowWeights(params, spudCount), typeFlow, mode)
+    if mode == 'convolution':
+        # clear FFT round-off on days with no flowing wells
+        qArr[wellsOfAge(cumSpud, max(totalNonFlowTime + 1, 0)) == 0] = 0.0
+        np.maximum(qArr, 0.0, out=qArr)
+
+    # decline of the first well, from its first flowing day
+    if len(spudDays):
+        decArr = typeFlow[max(totalNonFlowTime + 1, 0):numDays - spudDays[0]]
+    else:
+        decArr = np.zeros(0)
+
+    return FieldTimeline(tArr, qArr, decArr, np.rint(cumSpud).astype(int),
+                         wellsOfAge(cumSpud, drillTime),
+                         wellsOfAge(cumSpud, fracDoneTime),
+                         wellsOfAge(cumSpud, totalNonFlowTime))
+
+# Economic side of a simulation: prices a FieldTimeline
+# Each well pays for drilling, fracking and tie-in once, when it reaches that
+# stage, and earns from every scf produced.
+def priceField(timeline, params):
+    gasPrice = params['gasPrice']*params['exchangeRate'] # AUD/GJ
+    costToDrill = params['costToDrill']*1.0E6 # $
+    costToFrac = params['costToFrac']*1.0E6 # $
+    costToTieIn = params['costToTieIn']*1.0E6 # $
+
+    expenseArr = costToDrill*timeline.drilledArr + costToFrac*timeline.frackedArr + costToTieIn*timeline.tiedInArr
+    incomeArr = gasPrice/947.8171*timeline.cumQArr
+    exposureArr = incomeArr - expenseArr
+
+    return expenseArr, incomeArr, exposureArr
+
+# Largest capital at risk: the deepest point of exposureArr below zero
+def peakExposure(exposureArr):
+    return -min(float(np.min(exposureArr)), 0.0) if len(exposureArr) else 0.0
+
+# Discount rates (per year) the field summary values cash flows at
+SUMMARY_DISCOUNT_RATES = (0.0, 0.05, 0.10, 0.15)
+
+# Headline economics of a scenario. npv and breakevenGasPrice map each
+# discount rate to the NPV ($) and to the gas price (USD/GJ) at which NPV
+# is zero; irr is the annual rate at which NPV is zero and paybackDay the
+# day from which exposure stays non-negative, both None if there is none.
+class FieldSummary(object):
+
+    def __init__(self, npv, breakevenGasPrice, irr, paybackDay, peakExposure, totalGas, totalIncome, totalExpense):
+        self.npv = npv
+        self.breakevenGasPrice = breakevenGasPrice
+        self.irr = irr
+        self.paybackDay = paybackDay
+        self.peakExposure = peakExposure
+        self.totalGas = totalGas
+        self.totalIncome = totalIncome
+        self.totalExpense = totalExpense
+
+    def asDict(self):
+        return dict(vars(self))
+
+
+# NPV of daily cash flows at an annual rate, as a function of log(1 + rate)
+def discountedSum(tArr, cashFlow, logRate):
+    return float(np.dot(cashFlow, np.exp(-logRate*tArr/365.0)))
+
+# Annual rate at which the daily cash flows have zero NPV, by bisection
+# between -99% and 1000%; None when NPV does not change sign in that range
+def internalRate(tArr, cashFlow, tolerance=1.0E-10):
+    low, high = math.log(0.01), math.log(11.0)
+    npvLow, npvHigh = discountedSum(tArr, cashFlow, low), discountedSum(tArr, cashFlow, high)
+    if npvLow == 0.0 or npvLow*npvHigh > 0.0:
+        return None
+    while high - low > tolerance:
+        middle = 0.5*(low + high)
+        npvMiddle = discountedSum(tArr, cashFlow, middle)
+        if npvMiddle*npvLow > 0.0:
+            low, npvLow = middle, npvMiddle
+        else:
+            high = middle
+    return math.expm1(0.5*(low + high))
+
+# Summarises a priced FieldTimeline from its daily cash flows: gas sales on
+# each day and the drilling, frac and tie-in costs of the wells reaching each
+# stage that day. Every metric is read off the same discounted sums; gas
+# sales scale with the gas price, so the breakeven price is their ratio to
+# the discounted costs and needs no search. This runs as a separate pass over
+# the finished timeline rather than inside the simulation, which is
+# vectorised over whole arrays: two discounted sums per discount rate, plus
+# about 36 more for the IRR bisection.
+def fieldSummary(timeline, params, discountRates=SUMMARY_DISCOUNT_RATES):
+    gasPrice = params['gasPrice']*params['exchangeRate'] # AUD/GJ
+    tArr = np.asarray(timeline.tArr, dtype=float)
+    gasFlow = timeline.qArr/947.8171 # GJ/day
+    expenseFlow = (params['costToDrill']*np.diff(timeline.drilledArr, prepend=0.0) +
+                   params['costToFrac']*np.diff(timeline.frackedArr, prepend=0.0) +
+                   params['costToTieIn']*np.diff(timeline.tiedInArr, prepend=0.0))*1.0E6 # $/day
+    cashFlow = gasPrice*gasFlow - expenseFlow
+
+    npv = {}
+    breakevenGasPrice = {}
+    for rate in discountRates:
+        discountedGas = discountedSum(tArr, gasFlow, math.log1p(rate))
+        discountedExpense = discountedSum(tArr, expenseFlow, math.log1p(rate))
+        npv[rate] = gasPrice*discountedGas - discountedExpense
+        breakevenGasPrice[rate] = discountedExpense/(discountedGas*params['exchangeRate']) if discountedGas > 0 else None
+
+    exposureArr = np.cumsum(cashFlow)
+    underwater = np.flatnonzero(exposureArr < 0)
+    if not len(exposureArr):
+        paybackDay = None
+    elif not len(underwater):
+        paybackDay = int(tArr[0])
+    elif underwater[-1] + 1 < len(exposureArr):
+        paybackDay = int(tArr[underwater[-1] + 1])
+    else:
+        paybackDay = None
+
+    return FieldSummary(npv, breakevenGasPrice, internalRate(tArr, cashFlow), paybackDay,
+                        peakExposure(exposureArr), float(timeline.cumQArr[-1]) if len(tArr) else 0.0,
+                        gasPrice*float(gasFlow.sum()), float(expenseFlow.sum()))
+
+def simulateField(params, mode='auto'):
+    timeline = simulatePhysics(params, mode)
+    expenseArr, incomeArr, exposureArr = priceField(timeline, params)
+    return timeline.tArr, timeline.qArr, expenseArr, incomeArr, timeline.decArr, exposureArr, timeline.numWellArr
+
+# Number of wells per rig spudded on or before each of days
+def spudsUpTo(days, drillTime, stopDay):
+    days = np.minimum(np.asarray(days), math.floor(max(stopDay, 0)))
+    count = np.where(days >= 0, 1 + days//drillTime, 0)
+    if drillTime == 1:
+        # day 1 is never a spud day
+        count -= days >= 1
+    return count
+
+# Streaming simulation: yields the seven simulateField series in chunks of
+# chunkDays days, with cumulative expense and income carried between chunks.
+# Per-well peak flow multipliers are drawn chunk by chunk in spud order, so
+# the wells get the same multipliers as in simulateField. Under exponential
+# decline memory stays flat however long the horizon: wells already flowing
+# at the start of a chunk are on the same exponential decline, so they are
+# carried as one total flow, and only cohorts that start flowing inside the
+# chunk are added individually. Other decline models cannot be carried, so
+# each chunk's flow is the type well convolved with the spuds of every chunk
+# so far. Both are transformed once per chunk, the spuds over the chunk and
+# the type well over the two chunks' worth of ages that reach it, so a chunk
+# costs one inverse FFT plus a product per earlier chunk; these models keep
+# the type curve and both sets of spectra for the whole horizon. decArr is
+# yielded piecewise from its first flowing day.
+def iterSimulateField(params, chunkDays=365):
+    # economic parameters
+    gasPrice = params['gasPrice']*params['exchangeRate'] # AUD/GJ
+    costToDrill = params['costToDrill']*1.0E6 # $
+    costToFrac = params['costToFrac']*1.0E6 # $
+    costToTieIn = params['costToTieIn']*1.0E6 # $
+
+    # reservoir parameters
+    aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
+    aveDeclineTime = params['aveDecline']*365.0 # days to 10%
+    expParam = 2.30259/aveDeclineTime # param for exp decline curve
+
+    # well construction parameters
+    drillTime = int(params['drillTime']) # days
+    fracDoneTime = drillTime + int(params['fracWaitTime']) + int(params['fracTime']) # days
+    totalNonFlowTime = fracDoneTime + int(params['pipeWaitTime']) # days
+    flowStart = max(totalNonFlowTime + 1, 0) # first flowing age
+
+    # field construction parameters
+    rigsOperating = max(int(params['numRigs']), 0)
+    stopDay = rigStopTime(params)*365.0
+
+    # simulation parameters
+    t_fin = params['simTime']*365.0
+    numDays = int(math.floor(t_fin)) + 1 if t_fin >= 0 else 0
+
+    # other decline models gather from the type curve, as a type well indexed
+    # by age and padded by a chunk of zeros before and after
+    exponential = declineParams(params)['declineModel'] == 'exponential'
+    if not exponential:
+        table = typeCurve(params, numDays - min(totalNonFlowTime, 0))
+        blockDays = max(min(chunkDays, numDays), 1)
+        numBlocks = -(-numDays//blockDays)
+        ages = np.arange(numDays)
+        typeFlow = np.zeros((numBlocks + 2)*blockDays)
+        typeFlow[blockDays:blockDays + numDays] = np.where(ages > totalNonFlowTime,
+                                                           aveMaxFlow*table[np.maximum(ages - totalNonFlowTime, 0)], 0.0)
+        spudSpectra = np.zeros((numBlocks, blockDays + 1), dtype=complex)
+        curveSpectra = np.zeros((numBlocks, blockDays + 1), dtype=complex)
+    spread = float(declineParams(params)['flowSpread'])
+    rng = np.random.default_rng(int(declineParams(params)['wellSeed']))
+
+    cohortDays = np.zeros(0, dtype=int) # spud days of the cohorts not carried
+    cohortWeights = np.zeros(0) # and the sums of their wells' flow multipliers
+    carriedFlow = 0.0 # flow on day t0 of wells that started flowing before t0
+    fieldIncome = 0.0
+    for t0 in range(0, numDays, chunkDays):
+        t1 = min(t0 + chunkDays, numDays)
+        tArr = np.arange(t0, t1)
+
+        newDays = spudSchedule(drillTime, t1, stopDay, t0) if rigsOperating > 0 else np.zeros(0, dtype=int)
+        if spread > 0.0 and len(newDays):
+            multipliers = rng.lognormal(-0.5*spread**2, spread, rigsOperating*len(newDays))
+            newWeights = np.add.reduceat(multipliers, np.arange(0, len(multipliers), rigsOperating))
+        else:
+            newWeights = np.full(len(newDays), float(rigsOperating))
+
+        if exponential:
+            cohortDays = np.concatenate((cohortDays, newDays))
+            cohortWeights = np.concatenate((cohortWeights, newWeights))
+            flowing = cohortDays + flowStart < t1
+            qArr = carriedFlow*np.exp(-expParam*(tArr - t0))
+            nextFlow = carriedFlow*math.exp(-expParam*(t1 - t0))
+            for spudDay, weight in zip(cohortDays[flowing], cohortWeights[flowing]):
+                start = spudDay + flowStart - t0
+                qArr[start:] += weight*decline(aveMaxFlow, expParam, tArr[start:] - spudDay - totalNonFlowTime)
+                nextFlow += weight*decline(aveMaxFlow, expParam, t1 - spudDay - totalNonFlowTime)
+            carriedFlow = nextFlow
+            cohortDays, cohortWeights = cohortDays[~flowing], cohortWeights[~flowing]
+        else:
+            # chunk k's flow from the spuds of chunk j < k needs the type well
+            # at ages (k - j - 1)*blockDays + 1 to (k - j + 1)*blockDays - 1
+            k = t0//blockDays
+            spudCount = np.zeros(blockDays)
+            spudCount[newDays - t0] = newWeights
+            spudSpectra[k] = np.fft.rfft(spudCount, 2*blockDays)
+            curveSpectra[k] = np.fft.rfft(typeFlow[k*blockDays:(k + 2)*blockDays])
+            spectrum = np.einsum('ij,ij->j', spudSpectra[:k + 1], curveSpectra[k::-1])
+            qArr = np.fft.irfft(spectrum, 2*blockDays)[blockDays:blockDays + t1 - t0]
+            # clear FFT round-off on days with no flowing wells
+            qArr[tArr < flowStart] = 0.0
+            np.maximum(qArr, 0.0, out=qArr)
+
+        expenseArr = np.zeros(t1 - t0)
+        for eventAge, cost in ((drillTime, costToDrill), (fracDoneTime, costToFrac), (totalNonFlowTime, costToTieIn)):
+            if eventAge >= 0:
+                expenseArr += cost*rigsOperating*spudsUpTo(tArr - eventAge, drillTime, stopDay)
+
+        incomeArr = fieldIncome + np.cumsum(gasPrice*qArr/947.8171)
+        fieldIncome = incomeArr[-1]
+
+        flowing = tArr[tArr >= flowStart]
+        if rigsOperating <= 0:
+            decArr = np.zeros(0)
+        elif exponential:
+            decArr = decline(aveMaxFlow, expParam, flowing - totalNonFlowTime)
+        else:
+            decArr = aveMaxFlow*table[flowing - totalNonFlowTime]
+
+        yield (tArr, qArr, expenseArr, incomeArr, decArr, incomeArr - expenseArr,
+               rigsOperating*spudsUpTo(tArr, drillTime, stopDay))
+
+# Setup of Event-Driven Simulation
+
+# Event kinds, in the order they apply when they fall at the same time.
+# Reports come after spuds, costs and price changes but before flow starts,
+# so a well first reports flow the day after tie-in, as in the daily engines.
+EVENT_KINDS = ('spud', 'drilled', 'fracked', 'tiedIn', 'price', 'report', 'flow')
+SPUD, DRILLED, FRACKED, TIED_IN, PRICE, REPORT, FLOW = range(len(EVENT_KINDS))
+
+# Production of the flowing wells of an exponential decline, carried as one
+# total flow advanced in closed form. volume is the flow summed over the
+# whole days up to time, as the daily engines sum it, so it is a geometric
+# series between events.
+class FlowingWells(object):
+
+    def __init__(self, maxFlowRate, expParam):
+        self.maxFlowRate = maxFlowRate
+        self.expParam = expParam
+        self.time = 0.0
+        self.flow = 0.0
+        self.volume = 0.0
+
+    # Flow at times, none of them before self.time
+    def flowAt(self, times):
+        return self.flow*np.exp(-self.expParam*(np.asarray(times, dtype=float) - self.time))
+
+    # Flow summed over the whole days up to times, none of them before self.time
+    def volumeAt(self, times):
+        firstDay = math.floor(self.time) + 1
+        numDays = np.maximum(np.floor(np.asarray(times, dtype=float)) - firstDay + 1, 0.0)
+        firstFlow = self.flow*math.exp(-self.expParam*(firstDay - self.time))
+        return self.volume + firstFlow*np.expm1(-self.expParam*numDays)/math.expm1(-self.expParam)
+
+    def advance(self, time):
+        if time > self.time:
+            numDays = math.floor(time) - math.floor(self.time)
+            if numDays > 0:
+                firstFlow = self.flow*math.exp(-self.expParam*(math.floor(self.time) + 1 - self.time))
+                self.volume += firstFlow*math.expm1(-self.expParam*numDays)/math.expm1(-self.expParam)
+            self.flow *= math.exp(-self.expParam*(time - self.time))
+            self.time = time
+
+    # Starts weight wells flowing at time; they add nothing to that day's volume
+    def add(self, time, weight):
+        self.advance(time)
+        self.flow += weight*self.maxFlowRate
+
+
+# Event-driven simulation for exponential decline. Rig crews spudding wells,
+# drilling, frac and tie-in completions, first flow and gas price changes
+# are events on a queue; between events the flowing wells are one total
+# flow in closed form, so each event costs O(1) and the reports between two
+# events are computed together. Run time follows events plus reports, not
+# days times wells. Reports are at reportTimes (days, any spacing,
+# sub-daily included), by default every day of simTime, and give the
+# simulateField series at those times; on whole days they match
+# simulateField. Between days, flow is continuous from each well's tie-in,
+# while costs and income change by the day: income sums each whole day's
+# flow at that day's gas price, as the daily engines do. Optional params['priceSchedule'] holds (day,
+# gasPrice) pairs from which the gas price changes; the other engines price
+# at gasPrice throughout. Other decline models cannot be carried as one flow,
+# and simulateField's superposition of type curves is faster for them; so it
+# is for exponential decline reported daily at one gas price.
+def simulateFieldEvents(params, reportTimes=None):
+    curveParams = declineParams(params)
+    if curveParams['declineModel'] != 'exponential':
+        raise ValueError('simulateFieldEvents needs exponential decline, not %s' % curveParams['declineModel'])
+
+    # economic parameters
+    exchangeRate = params['exchangeRate']
+    gasPrice = params['gasPrice']*exchangeRate # AUD/GJ
+    costToDrill = params['costToDrill']*1.0E6 # $
+    costToFrac = params['costToFrac']*1.0E6 # $
+    costToTieIn = params['costToTieIn']*1.0E6 # $
+
+    # reservoir parameters
+    aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
+    aveDeclineTime = params['aveDecline']*365.0 # days to 10%
+    expParam = 2.30259/aveDeclineTime # param for exp decline curve
+
+    # well construction parameters
+    drillTime = int(params['drillTime']) # days
+    fracDoneTime = drillTime + int(params['fracWaitTime']) + int(params['fracTime']) # days
+    totalNonFlowTime = fracDoneTime + int(params['pipeWaitTime']) # days
+
+    # field construction parameters
+    rigsOperating = max(int(params['numRigs']), 0)
+    stopDay = rigStopTime(params)*365.0
+
+    # simulation parameters
+    if reportTimes is None:
+        t_fin = params['simTime']*365.0
+        tArr = np.arange(int(math.floor(t_fin)) + 1 if t_fin >= 0 else 0)
+    else:
+        tArr = np.sort(np.asarray(reportTimes, dtype=float))
+    horizon = float(tArr[-1]) if len(tArr) else -1.0
+
+    # per-well peak flows, drawn as the wells are spudded
+    spread = float(curveParams['flowSpread'])
+    rng = np.random.default_rng(int(curveParams['wellSeed']))
+
+    events = [] # (time, kind, weight)
+    def schedule(time, kind, weight=0.0):
+        if time <= horizon:
+            heapq.heappush(events, (time, kind, weight))
+
+    if rigsOperating > 0:
+        schedule(0, SPUD)
+    for day, price in params.get('priceSchedule', ()):
+        schedule(max(float(day), 0.0), PRICE, price*exchangeRate)
+
+    wells = FlowingWells(aveMaxFlow, expParam)
+    costs = {DRILLED: costToDrill, FRACKED: costToFrac, TIED_IN: costToTieIn}
+    numWells = 0
+    fieldExpense = 0.0
+    fieldIncome = 0.0 # income up to the last price change
+    soldVolume = 0.0 # and the gas volume it was paid for
+
+    qArr = np.zeros(len(tArr))
+    expenseArr = np.zeros(len(tArr))
+    incomeArr = np.zeros(len(tArr))
+    numWellArr = np.zeros(len(tArr), dtype=int)
+
+    report = 0
+    while report < len(tArr):
+        # reports that come before the next event
+        if events:
+            time, kind, weight = events[0]
+            end = np.searchsorted(tArr, time, side='right' if kind > REPORT else 'left')
+        else:
+            end = len(tArr)
+        if end > report:
+            reports = slice(report, end)
+            qArr[reports] = wells.flowAt(tArr[reports])
+            expenseArr[reports] = fieldExpense
+            incomeArr[reports] = fieldIncome + gasPrice/947.8171*(wells.volumeAt(tArr[reports]) - soldVolume)
+            numWellArr[reports] = numWells
+            report = end
+        if not events:
+            break
+
+        time, kind, weight = heapq.heappop(events)
+        if kind == SPUD:
+            numWells += rigsOperating
+            weight = rigsOperating if spread <= 0.0 else float(rng.lognormal(-0.5*spread**2, spread, rigsOperating).sum())
+            for eventAge, stage in ((drillTime, DRILLED), (fracDoneTime, FRACKED), (totalNonFlowTime, TIED_IN)):
+                if eventAge >= 0:
+                    schedule(time + eventAge, stage)
+            schedule(time + totalNonFlowTime, FLOW, weight)
+            # the crews move on to the next well; as in spudSchedule, day 1 is never a spud day
+            nextSpud = time + drillTime if time + drillTime > 1 else 2
+            if nextSpud <= stopDay:
+                schedule(nextSpud, SPUD)
+        elif kind == FLOW:
+            wells.add(time, weight)
+        elif kind == PRICE:
+            # a whole day is sold at the price from that day on
+            wells.advance(time)
+            dayFlow = wells.flow if time == math.floor(time) else 0.0
+            fieldIncome += gasPrice/947.8171*(wells.volume - dayFlow - soldVolume)
+            soldVolume = wells.volume - dayFlow
+            gasPrice = weight
+        else:
+            fieldExpense += costs[kind]*rigsOperating
+
+    # decline of the first well, from its first flowing report
+    if rigsOperating > 0:
+        flowing = tArr[tArr > totalNonFlowTime]
+        decArr = decline(aveMaxFlow, expParam, flowing - totalNonFlowTime)
+    else:
+        decArr = np.zeros(0)
+
+    return tArr, qArr, expenseArr, incomeArr, decArr, incomeArr - expenseArr, numWellArr
+
+# Reference day-by-day simulation stepping a WellFleet
+# Kept to check the vectorized engine against; too slow for the app.
+#@jit(nopython=True)
+def simulateFieldReference(params):
+    # economic parameters
+    gasPriceRaw = params['gasPrice'] #3.0 # USD/GJ
+    USDAUD = params['exchangeRate'] #1.31 # $
+    gasPrice = gasPriceRaw*USDAUD # AUD/GJ
+    costToDrill = params['costToDrill']*1.0E6 #3.0E6 # $
+    costToFrac = params['costToFrac']*1.0E6 #2.0E6 # $
+    costToTieIn = params['costToTieIn']*1.0E6 #0.5E6 # $
+
+    # reservoir parameters
+    aveMaxFlow = params['aveFlow']*1.0E6 # scf/day
+    aveDeclineTime = params['aveDecline']*365.0 # days to 10%
+    expParam = 2.30259/aveDeclineTime # param for exp decline curve
+
+    # well construction parameters
+    drillTime = params['drillTime'] # days
+    drillToFracTime = params['fracWaitTime'] # days
+    fracTime = params['fracTime'] # days
+    fracToFlowTime = params['pipeWaitTime'] # days
+    totalNonFlowTime = drillTime + drillToFracTime + fracTime + fracToFlowTime # days
+
+    # field construction parameters
+    rigsOperating = params['numRigs']
+    rigStopDay = rigStopTime(params)*365.0
+
+    # target flow rate
+    flowTarget = params['tgtFlow'] # TJ/day
+    flowTargetCF = flowTarget*947817.12 # cubicfeet/day
+
+    # simulation parameters
+    t_init = 0.0
+    t_fin = params['simTime']*365.0
+
+    # decline model and per-well peak flows
+    curveParams = declineParams(params)
+    curve = None
+    if curveParams['declineModel'] != 'exponential':
+        curve = typeCurve(params, int(math.floor(t_fin)) + 1)
+    spread = float(curveParams['flowSpread'])
+    rng = np.random.default_rng(int(curveParams['wellSeed']))
+
+    def wellPeakFlows(count):
+        if spread <= 0.0:
+            return aveMaxFlow
+        return aveMaxFlow*rng.lognormal(-0.5*spread**2, spread, max(count, 0))
+
+    # Algorithm
+
+    field = Field('Fairfields', WellFleet(drillTime, drillToFracTime, fracTime, fracToFlowTime, expParam, typeCurve=curve))
+    field.wells.addWells(rigsOperating, wellPeakFlows(rigsOperating))
+
+    tArr = []
+    qArr = []
+    decArr = []
+
+    expenseArr = []
+    incomeArr = []
+    exposureArr = []
+    numWellArr = []
+
+    fieldExpense = 0
+    fieldIncome = 0
+
+    t = 0
+    while t <= t_fin:
+        if t%drillTime == 0 and t > 1 and t <= rigStopDay:
+            field.wells.addWells(rigsOperating, wellPeakFlows(rigsOperating), t)
+
+        # Add to Field Expense
+        age = field.wells.getAge()
+        fieldExpense += costToDrill*np.count_nonzero(age == drillTime)
+        fieldExpense += costToFrac*np.count_nonzero(age == drillTime + drillToFracTime + fracTime)
+        fieldExpense += costToTieIn*np.count_nonzero(age == totalNonFlowTime)
+
+        if len(field.wells) > 0 and age[0] > totalNonFlowTime:
+            decArr.append(float(field.wells.wellFlow(aveMaxFlow, age[0] - totalNonFlowTime)))
+
+        fieldFlow = field.getFlow()
+        fieldIncome += gasPrice*fieldFlow/947.8171
+
+        field.wells.step()
+
+        tArr.append(t)
+        qArr.append(fieldFlow)
+        expenseArr.append(fieldExpense)
+        incomeArr.append(fieldIncome)
+        exposureArr.append(fieldIncome - fieldExpense)
+        numWellArr.append(len(field.wells))
+
+        t += 1
+
+    return tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr
+
+
+# Setup of Simulation Cache
+
+# Keys of the params dict that change the simulation results
+PHYSICAL_PARAM_KEYS = ('simTime', 'numRigs', 'drillTime', 'fracWaitTime', 'fracTime', 'pipeWaitTime',
+                       'aveFlow', 'aveDecline', 'rigStopTime') + tuple(DECLINE_DEFAULTS)
+ECONOMIC_PARAM_KEYS = ('gasPrice', 'exchangeRate', 'costToDrill', 'costToFrac', 'costToTieIn')
+SIM_PARAM_KEYS = PHYSICAL_PARAM_KEYS + ECONOMIC_PARAM_KEYS
+
+def paramsKey(params, keys=SIM_PARAM_KEYS):
+    params = dict(params, rigStopTime=rigStopTime(params), **declineParams(params))
+    return tuple((key, params[key] if isinstance(params[key], str) else float(params[key])) for key in keys)
+
+
+class SimulationCache(object):
+
+    def __init__(self, maxSize=256, ttl=3600.0):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # Membership test that leaves the hit/miss counters and LRU order alone
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def getStats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxSize': self.maxSize}
+
+
+simCache = SimulationCache()
+physicsCache = SimulationCache()
+typeCurveCache = SimulationCache(maxSize=64)
+summaryCache = SimulationCache()
+planCache = SimulationCache()
+
+def freeze(arrays):
+    for arr in arrays:
+        arr.flags.writeable = False
+    return arrays
+
+# Precomputed scenarios (a gasFieldGrid.ScenarioGrid) consulted before simulating
+scenarioGrid = None
+
+def setScenarioGrid(grid):
+    global scenarioGrid
+    scenarioGrid = grid
+
+def onScenarioGrid(params):
+    return scenarioGrid is not None and scenarioGrid.covers(params)
+
+# Results shared with other worker processes (a gasFieldStore.ResultStore)
+resultStore = None
+
+def setResultStore(store):
+    global resultStore
+    resultStore = store
+
+def inResultStore(params):
+    return resultStore is not None and paramsKey(params, PHYSICAL_PARAM_KEYS) in resultStore
+
+# simulatePhysics and simulateField through the caches; the cached arrays are
+# shared, so they are read-only. An economics-only edit finds its FieldTimeline
+# in physicsCache and is just re-priced. Misses are looked up on the scenario
+# grid and then in the shared result store, when there are any, before
+# simulating; what is simulated goes into the store for the other workers.
+def cachedSimulatePhysics(params):
+    key = paramsKey(params, PHYSICAL_PARAM_KEYS)
+    timeline = physicsCache.get(key)
+    if timeline is None:
+        timeline = scenarioGrid.lookup(params) if scenarioGrid is not None else None
+        if timeline is None and resultStore is not None:
+            timeline = resultStore.getOrCompute(key, lambda: simulatePhysics(params))
+        if timeline is None:
+            timeline = simulatePhysics(params)
+        freeze(timeline.arrays())
+        physicsCache.put(key, timeline)
+    return timeline
+
+def cachedSimulateField(params):
+    key = paramsKey(params)
+    results = simCache.get(key)
+    if results is None:
+        timeline = cachedSimulatePhysics(params)
+        expenseArr, incomeArr, exposureArr = priceField(timeline, params)
+        results = freeze((timeline.tArr, timeline.qArr, expenseArr, incomeArr,
+                          timeline.decArr, exposureArr, timeline.numWellArr))
+        simCache.put(key, results)
+    return results
+
+
+# fieldSummary through a cache, with the FieldTimeline from physicsCache
+def cachedFieldSummary(params, discountRates=SUMMARY_DISCOUNT_RATES):
+    key = paramsKey(params) + (('discountRates', tuple(discountRates)),)
+    summary = summaryCache.get(key)
+    if summary is None:
+        summary = fieldSummary(cachedSimulatePhysics(params), params, discountRates)
+        summaryCache.put(key, summary)
+    return summary
+
+
+# Setup of Uncertainty Analysis
+
+# Distributions are (kind, *args) tuples:
+#   ('uniform', low, high), ('triangular', low, mode, high),
+#   ('normal', mean, sd), ('lognormal', mean, sigma) with mean of the underlying normal
+# Day-valued params (e.g. drillTime) are rounded to whole days, at least 1.
+INTEGER_PARAM_KEYS = ('simTime', 'numRigs', 'drillTime', 'fracWaitTime', 'fracTime', 'pipeWaitTime')
+
+def sampleParams(params, distributions, numSamples, rng):
+    columns = {}
+    for key, dist in distributions.items():
+        kind, args = dist[0], dist[1:]
+        if kind not in ('uniform', 'triangular', 'normal', 'lognormal'):
+            raise ValueError('Unknown distribution for %s: %s' % (key, kind))
+        values = getattr(rng, kind)(*args, size=numSamples)
+        if key in INTEGER_PARAM_KEYS:
+            values = np.maximum(np.rint(values), 1).astype(int)
+        columns[key] = values.tolist()
+
+    samples = []
+    for i in range(numSamples):
+        sample = dict(params)
+        for key, values in columns.items():
+            sample[key] = values[i]
+        samples.append(sample)
+    return samples
+
+# Worker for runMonteCarlo: production and exposure rows for a chunk of samples
+def simulateSamples(samples):
+    qRows = []
+    exposureRows = []
+    for sample in samples:
+        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = simulateField(sample)
+        qRows.append(qArr)
+        exposureRows.append(exposureArr)
+    return np.array(qRows), np.array(exposureRows)
+
+
+# Uniform random subset of at most maxSize trajectories (reservoir sampling),
+# so percentiles can be taken over any number of runs in bounded memory
+class TrajectoryReservoir(object):
+
+    def __init__(self, maxSize, rng):
+        self.maxSize = maxSize
+        self.rng = rng
+        self.seen = 0
+        self.rows = None
+
+    def add(self, rows):
+        for row in rows:
+            if self.rows is None:
+                self.rows = np.empty((self.maxSize, len(row)))
+            if self.seen < self.maxSize:
+                self.rows[self.seen] = row
+            else:
+                j = self.rng.integers(0, self.seen + 1)
+                if j < self.maxSize:
+                    self.rows[j] = row
+            self.seen += 1
+
+    def getPercentiles(self, percentiles):
+        kept = self.rows[:min(self.seen, self.maxSize)]
+        return dict(zip(percentiles, np.percentile(kept, percentiles, axis=0)))
+
+
+# Runs numSamples simulations with params drawn from distributions and yields
+# (samplesDone, bands) every reportEvery samples and once all are done. bands
+# maps 'qArr' and 'exposureArr' to {percentile: array over tArr}; they are
+# exact while numSamples <= maxTrajectories and estimated from a uniform
+# subset beyond.
+def iterMonteCarlo(params, distributions, numSamples, percentiles=(10, 50, 90), workers=None,
+                   chunkSize=64, maxTrajectories=2000, reportEvery=1000, seed=None):
+    if 'simTime' in distributions:
+        raise ValueError('simTime must be fixed so all runs share tArr')
+
+    rng = np.random.default_rng(seed)
+    samples = sampleParams(params, distributions, numSamples, rng)
+    chunks = [samples[i:i + chunkSize] for i in range(0, numSamples, chunkSize)]
+
+    qReservoir = TrajectoryReservoir(maxTrajectories, rng)
+    exposureReservoir = TrajectoryReservoir(maxTrajectories, rng)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        results = map(simulateSamples, chunks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(chunks)))
+        results = pool.map(simulateSamples, chunks)
+
+    try:
+        samplesDone = 0
+        nextReport = reportEvery
+        for chunk, (qRows, exposureRows) in zip(chunks, results):
+            qReservoir.add(qRows)
+            exposureReservoir.add(exposureRows)
+            samplesDone += len(chunk)
+            if samplesDone >= nextReport or samplesDone == numSamples:
+                nextReport = samplesDone + reportEvery
+                yield samplesDone, {
+                    'qArr': qReservoir.getPercentiles(percentiles),
+                    'exposureArr': exposureReservoir.getPercentiles(percentiles)
+                }
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def runMonteCarlo(params, distributions, numSamples, **kwargs):
+    result = None
+    for samplesDone, bands in iterMonteCarlo(params, distributions, numSamples, **kwargs):
+        result = bands
+    return result
+
+
+# Setup of Sensitivity Analysis
+
+# Smallest value each integer param can be perturbed to
+PARAM_MINIMUMS = {'simTime': 1, 'numRigs': 1, 'drillTime': 1}
+
+def perturbParam(params, key, factor):
+    value = params[key]*factor
+    if key in INTEGER_PARAM_KEYS:
+        value = int(round(value))
+        if value == params[key]:
+            value += 1 if factor > 1.0 else -1
+        value = max(value, PARAM_MINIMUMS.get(key, 0))
+    perturbed = dict(params)
+    perturbed[key] = value
+    return perturbed
+
+# Worker for runSensitivity: (NPV, peak exposure) of one scenario
+def scenarioMetrics(scenario):
+    params, discountRate = scenario
+    summary = fieldSummary(simulatePhysics(params), params, (discountRate,))
+    return summary.npv[discountRate], summary.peakExposure
+
+def parallelMap(func, items, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) <= 1:
+        return list(map(func, items))
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+# One-at-a-time sensitivity: each key of params (by default every numeric
+# one) is moved down and up by fraction and the NPV and peak exposure deltas
+# from the base case recorded. Rows are sorted by NPV swing, largest first.
+def runSensitivity(params, fraction=0.1, discountRate=0.1, keys=None, workers=None):
+    keys = keys or [key for key in params if not isinstance(params[key], str)]
+    scenarios = [(params, discountRate)]
+    for key in keys:
+        scenarios.append((perturbParam(params, key, 1.0 - fraction), discountRate))
+        scenarios.append((perturbParam(params, key, 1.0 + fraction), discountRate))
+
+    metrics = parallelMap(scenarioMetrics, scenarios, workers)
+    baseNPV, baseExposure = metrics[0]
+
+    rows = []
+    for i, key in enumerate(keys):
+        (npvLow, exposureLow), (npvHigh, exposureHigh) = metrics[2*i + 1], metrics[2*i + 2]
+        rows.append({
+            'key': key,
+            'lowValue': scenarios[2*i + 1][0][key],
+            'highValue': scenarios[2*i + 2][0][key],
+            'npvLow': npvLow - baseNPV,
+            'npvHigh': npvHigh - baseNPV,
+            'exposureLow': exposureLow - baseExposure,
+            'exposureHigh': exposureHigh - baseExposure
+        })
+    rows.sort(key=lambda row: abs(row['npvHigh'] - row['npvLow']), reverse=True)
+
+    return {'npv': baseNPV, 'peakExposure': baseExposure, 'rows': rows}
+
+
+# Setup of Development Optimizer
+
+# Highest flow qArr holds for plateauDays in a row
+def plateauLevel(qArr, plateauDays):
+    if plateauDays > len(qArr):
+        return 0.0
+    return float(np.lib.stride_tricks.sliding_window_view(qArr, plateauDays).min(axis=1).max())
+
+# Production and exposure of a candidate plan. The search runs its many
+# single-rig plans through planCache, so they do not evict the scenarios the
+# user works with from simCache and physicsCache.
+def planSeries(plan):
+    key = paramsKey(plan)
+    series = planCache.get(key)
+    if series is None:
+        tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = simulateField(plan)
+        series = freeze((qArr, exposureArr))
+        planCache.put(key, series)
+    return series
+
+# Searches drillTime, rigStopTime and numRigs for the plan that holds
+# params['tgtFlow'] for plateauTime years with the least peak exposure.
+# Production and cash flow scale linearly with numRigs, so each
+# (drillTime, rigStopTime) pair is simulated once with a single rig and the
+# smallest rig count meeting the target is read off that. Stop times are
+# searched in increasing order; a plan matches the no-stop run up to its
+# stop day, so once the no-stop run's exposure up to that day already
+# exceeds the best plan the remaining stop times are pruned.
+# With flowSpread the scaling is only an estimate: per-well flows are drawn
+# in spud order, so more rigs draw different wells. Each plan is then
+# simulated at the estimated rig count, with rigs added until it holds the
+# target, and nothing is pruned.
+def optimizePlan(params, plateauTime=2.0, maxRigs=20, drillTimes=range(10, 95, 5), rigStopStep=0.25):
+    flowTarget = params['tgtFlow']*947817.12 # cubicfeet/day
+    plateauDays = max(int(plateauTime*365.0), 1)
+    stopTimes = np.arange(1, int(params['simTime']/rigStopStep) + 1)*rigStopStep
+
+    def requiredRigs(qArr):
+        level = plateauLevel(qArr, plateauDays)
+        if level <= 0.0:
+            return None, level
+        rigs = max(int(math.ceil(flowTarget/level)), 1)
+        return (rigs if rigs <= maxRigs else None), level
+
+    scales = declineParams(params)['flowSpread'] <= 0.0
+
+    best = None
+    evaluated = 0
+    for drillTime in drillTimes:
+        unit = dict(params, numRigs=1, drillTime=drillTime)
+        unit.pop('rigStopTime', None)
+        qArr, exposureArr = planSeries(unit)
+        evaluated += 1
+
+        minRigs, level = requiredRigs(qArr)
+        if minRigs is None:
+            continue
+        runningPeak = np.maximum.accumulate(-np.minimum(exposureArr, 0.0))
+
+        for stopTime in stopTimes:
+            stopDay = min(int(stopTime*365.0), len(runningPeak) - 1)
+            if scales and best is not None and minRigs*runningPeak[stopDay] >= best['peakExposure']:
+                break
+
+            plan = dict(unit, rigStopTime=float(stopTime))
+            qArr, exposureArr = planSeries(plan)
+            evaluated += 1
+
+            rigs, level = requiredRigs(qArr)
+            if rigs is None:
+                continue
+            if scales:
+                peak, plateauFlow = rigs*peakExposure(exposureArr), rigs*level
+            else:
+                while True:
+                    qArr, exposureArr = planSeries(dict(plan, numRigs=rigs))
+                    evaluated += 1
+                    plateauFlow = plateauLevel(qArr, plateauDays)
+                    if plateauFlow >= flowTarget or rigs >= maxRigs:
+                        break
+                    rigs += 1
+                if plateauFlow < flowTarget:
+                    continue
+                peak = peakExposure(exposureArr)
+            if best is None or peak < best['peakExposure']:
+                best = {'params': dict(plan, numRigs=rigs), 'peakExposure': peak, 'plateauFlow': plateauFlow}
+
+    return {'best': best, 'evaluated': evaluated}
+
+
+# Setup of Portfolio Simulation
+
+# Rig scheduling policies for a shared rig fleet:
+#   'priority' - a free rig goes to the first field, in portfolio order, with wells left to drill
+#   'balanced' - a free rig goes to the field with the fewest wells drilled so far, among
+#                those with wells left to drill (ties go to the first in portfolio order)
+SCHEDULE_POLICIES = ('priority', 'balanced')
+
+# Wells spudded on each day in each field by numRigs rigs shared across the
+# fields, as an array of shape (len(fields), numDays). A rig that finishes a
+# well picks its next field by policy and spends that field's drillTime on
+# it; rigs stop once every field has maxWells wells or after stopDay.
+def scheduleRigs(fields, numRigs, numDays, stopDay=None, policy='priority'):
+    if policy not in SCHEDULE_POLICIES:
+        raise ValueError('Unknown scheduling policy: %s' % policy)
+
+    numFields = len(fields)
+    drillTimes = [max(int(field.params['drillTime']), 1) for field in fields]
+    maxWells = [field.params.get('maxWells', math.inf) for field in fields]
+    drilled = [0]*numFields
+    spudCount = np.zeros((numFields, numDays))
+    lastDay = numDays - 1 if stopDay is None else min(math.floor(stopDay), numDays - 1)
+
+    rigs = [(0, rig) for rig in range(max(int(numRigs), 0))]
+    heapq.heapify(rigs)
+    while rigs and rigs[0][0] <= lastDay:
+        day, rig = heapq.heappop(rigs)
+        openFields = [i for i in range(numFields) if drilled[i] < maxWells[i]]
+        if not openFields:
+            break
+        if policy == 'priority':
+            i = openFields[0]
+        else:
+            i = min(openFields, key=lambda i: drilled[i])
+        spudCount[i, day] += 1
+        drilled[i] += 1
+        heapq.heappush(rigs, (day + drillTimes[i], rig))
+    return spudCount
+
+# Worker for simulatePortfolio: the simulateField series of one scheduled field
+def simulateScheduledField(job):
+    params, spudCount, mode = job
+    timeline = scheduledPhysics(params, spudCount, mode)
+    expenseArr, incomeArr, exposureArr = priceField(timeline, params)
+    return timeline.tArr, timeline.qArr, expenseArr, incomeArr, timeline.decArr, exposureArr, timeline.numWellArr
+
+# Simulates a portfolio of Fields, each with its own params, drilled by a
+# shared fleet of numRigs rigs for simTime years (rigs stop spudding after
+# rigStopTime years if given). Fields are scheduled together, then each is
+# simulated with the vectorized engine, in parallel across workers
+# processes. Returns the series of each field, keyed by name, and the
+# portfolio totals of qArr, expenseArr, incomeArr, exposureArr and numWellArr.
+def simulatePortfolio(fields, numRigs, simTime, rigStopTime=None, policy='priority', mode='auto', workers=None):
+    names = [field.name for field in fields]
+    if len(set(names)) != len(names):
+        raise ValueError('Field names in a portfolio must be unique')
+
+    t_fin = simTime*365.0
+    numDays = int(math.floor(t_fin)) + 1 if t_fin >= 0 else 0
+    stopDay = min(rigStopTime, simTime)*365.0 if rigStopTime is not None else None
+    spudCount = scheduleRigs(fields, numRigs, numDays, stopDay, policy)
+
+    jobs = [(field.params, spudCount[i], mode) for i, field in enumerate(fields)]
+    results = parallelMap(simulateScheduledField, jobs, workers)
+
+    portfolio = {'tArr': np.arange(numDays), 'fields': OrderedDict(zip(names, results))}
+    for name, index in (('qArr', 1), ('expenseArr', 2), ('incomeArr', 3), ('exposureArr', 5), ('numWellArr', 6)):
+        portfolio[name] = np.sum([result[index] for result in results], axis=0) if results else np.zeros(numDays)
+    return portfolio
+
+
+# Default scenario, shown when the app first loads
+DEFAULT_PARAMS = {
+    'simTime': 5,
+    'tgtFlow': 25.0,
+    'numRigs': 2,
+    'drillTime': 30,
+    'fracWaitTime': 60,
+    'fracTime': 10,
+    'pipeWaitTime': 160,
+    'aveFlow': 1.0,
+    'aveDecline': 4,
+    'gasPrice': 10.0,
+    'exchangeRate': 1.31,
+    'costToDrill': 3.0,
+    'costToFrac': 2.0,
+    'costToTieIn': 0.5
+}
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# Result store shared by the worker processes of a multi-worker deployment.
+#
+#   GASFIELD_STORE=/var/cache/gasfield.sqlite gunicorn -w 4 'gasFieldApp:createServer()'
+#
+# Simulated FieldTimelines are kept in an SQLite database (in WAL mode, so
+# readers never block) keyed by a hash of their physical params, and any
+# worker can price them. The database is kept under maxBytes
+# (GASFIELD_STORE_BYTES) by evicting the least recently used results. A
+# worker about to simulate a scenario first claims it; workers asking for a
+# scenario another worker has claimed wait for its result rather than
+# simulating it again, unless the claim is older than claimTimeout. Job
+# status is kept here too, so a job's progress can be polled from any worker.
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from gasFieldSim import FieldTimeline
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS resultsAccessed ON results (accessed);
+CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, claimed REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, progress REAL NOT NULL, error TEXT,
+                                 params TEXT NOT NULL, cancelled INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL);
+'''
+
+TIMELINE_ARRAYS = ('qArr', 'decArr', 'numWellArr', 'drilledArr', 'frackedArr', 'tiedInArr')
+
+def encodeTimeline(timeline):
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: getattr(timeline, name) for name in TIMELINE_ARRAYS})
+    return buffer.getvalue()
+
+def decodeTimeline(value):
+    arrays = np.load(io.BytesIO(value), allow_pickle=False)
+    return FieldTimeline(np.arange(len(arrays['qArr'])), *(arrays[name] for name in TIMELINE_ARRAYS))
+
+def storeKey(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class ResultStore(object):
+
+    def __init__(self, path, maxBytes=512*2**20, claimTimeout=60.0, pollInterval=0.05, jobTTL=3600.0):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.claimTimeout = claimTimeout
+        self.pollInterval = pollInterval
+        self.jobTTL = jobTTL
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    # One connection per thread and process; a forked worker opens its own
+    def connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        key = storeKey(key)
+        connection = self.connection()
+        row = connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def __contains__(self, key):
+        return self.connection().execute('SELECT 1 FROM results WHERE key = ?', (storeKey(key),)).fetchone() is not None
+
+    def put(self, key, value):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (storeKey(key), value, len(value), time.time()))
+            self.evict(connection)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    # Drops least recently used results until the store is under maxBytes
+    def evict(self, connection):
+        excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0] - self.maxBytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in connection.execute('SELECT key, size FROM results ORDER BY accessed'):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    # Claims key for this worker to compute, unless another worker holds a
+    # claim on it that is not yet stale
+    def claim(self, key):
+        key = storeKey(key)
+        now = time.time()
+        connection = self.connection()
+        if connection.execute('INSERT OR IGNORE INTO claims VALUES (?, ?)', (key, now)).rowcount:
+            return True
+        return connection.execute('UPDATE claims SET claimed = ? WHERE key = ? AND claimed < ?',
+                                  (now, key, now - self.claimTimeout)).rowcount > 0
+
+    def release(self, key):
+        self.connection().execute('DELETE FROM claims WHERE key = ?', (storeKey(key),))
+
+    # Value of key, from the store, from the worker computing it, or from compute()
+    def getOrCompute(self, key, compute, encode=encodeTimeline, decode=decodeTimeline):
+        value = self.get(key)
+        if value is not None:
+            self.count('hits')
+            return decode(value)
+
+        waited = False
+        while True:
+            if self.claim(key):
+                try:
+                    value = self.get(key)
+                    if value is not None:
+                        return decode(value)
+                    self.count('misses')
+                    result = compute()
+                    self.put(key, encode(result))
+                    return result
+                finally:
+                    self.release(key)
+
+            if not waited:
+                self.count('waits')
+                waited = True
+            time.sleep(self.pollInterval)
+            value = self.get(key)
+            if value is not None:
+                return decode(value)
+
+    # Jobs, as dicts of status, progress, error and params
+
+    def putJob(self, jobId, status, progress, error, params):
+        now = time.time()
+        connection = self.connection()
+        connection.execute('INSERT INTO jobs (id, status, progress, error, params, updated) VALUES (?, ?, ?, ?, ?, ?) '
+                           'ON CONFLICT (id) DO UPDATE SET status = excluded.status, progress = excluded.progress, '
+                           'error = excluded.error, updated = excluded.updated',
+                           (jobId, status, progress, error, json.dumps(params), now))
+        if status == 'queued':
+            connection.execute('DELETE FROM jobs WHERE updated < ?', (now - self.jobTTL,))
+
+    def getJob(self, jobId):
+        row = self.connection().execute('SELECT status, progress, error, params, cancelled FROM jobs WHERE id = ?',
+                                        (jobId,)).fetchone()
+        if row is None:
+            return None
+        status, progress, error, params, cancelled = row
+        return {'status': status, 'progress': progress, 'error': error, 'params': json.loads(params),
+                'cancelled': bool(cancelled)}
+
+    def cancelJob(self, jobId):
+        self.connection().execute('UPDATE jobs SET cancelled = 1 WHERE id = ?', (jobId,))
+
+    def isJobCancelled(self, jobId):
+        row = self.connection().execute('SELECT cancelled FROM jobs WHERE id = ?', (jobId,)).fetchone()
+        return row is not None and bool(row[0])
+
+    def getStats(self):
+        size, count = self.connection().execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM results').fetchone()
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'size': count,
+                    'bytes': size, 'maxBytes': self.maxBytes}
+
+
+def storeFromEnvironment(environ=os.environ):
+    path = environ.get('GASFIELD_STORE')
+    if not path:
+        return None
+    return ResultStore(path, maxBytes=int(environ.get('GASFIELD_STORE_BYTES', 512*2**20)))
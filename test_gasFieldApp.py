@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Checks of the figure downsampling against straightforward versions of it,
+# and of job polling across worker processes.
+#
+#   python -m pytest -q
+import time
+
+import numpy as np
+import pytest
+
+import gasFieldApp as gfa
+
+
+# Largest-triangle-three-buckets one point at a time, with the same buckets
+# as lttbIndices: the first and last points alone, the rest split evenly
+def naiveLttb(x, y, numPoints):
+    edges = np.linspace(1, len(x) - 1, numPoints - 1).astype(int)
+    indices = [0]
+    for i in range(numPoints - 2):
+        if i + 2 < len(edges):
+            nextX = x[edges[i + 1]:edges[i + 2]].mean()
+            nextY = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            nextX, nextY = x[-1], y[-1]
+        a = indices[-1]
+        best, bestArea = None, -1.0
+        for j in range(edges[i], edges[i + 1]):
+            area = abs((x[a] - nextX)*(y[j] - y[a]) - (x[a] - x[j])*(nextY - y[a]))
+            if area > bestArea:
+                best, bestArea = j, area
+        indices.append(best)
+    indices.append(len(x) - 1)
+    return np.array(indices)
+
+def randomSeries(seed, size):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.uniform(0.5, 1.5, size)), np.cumsum(rng.normal(size=size))
+
+
+@pytest.mark.parametrize('size, numPoints', [(10, 3), (100, 7), (1000, 100), (1001, 999), (5000, 1000)])
+def test_lttbIndices_matches_naive_lttb(size, numPoints):
+    x, y = randomSeries(size, size)
+    np.testing.assert_array_equal(gfa.lttbIndices(x, y, numPoints), naiveLttb(x, y, numPoints))
+
+@pytest.mark.parametrize('numPoints', [1, 2, 50, 60])
+def test_lttbIndices_keeps_short_series(numPoints):
+    x, y = randomSeries(0, 50)
+    np.testing.assert_array_equal(gfa.lttbIndices(x, y, numPoints), np.arange(50))
+
+@pytest.mark.parametrize('size, numPoints', [(10, 2), (10, 3), (10, 4), (101, 10), (1000, 999), (5000, 1000),
+                                             (5001, 7)])
+def test_minMaxIndices_keeps_extremes_within_budget(size, numPoints):
+    x, y = randomSeries(size, size)
+    indices = gfa.minMaxIndices(y, numPoints)
+    assert len(indices) <= numPoints
+    assert np.all(np.diff(indices) > 0)
+    assert indices[0] == 0 and indices[-1] == size - 1
+    if numPoints >= 4:
+        assert np.argmin(y) in indices and np.argmax(y) in indices
+
+def test_minMaxIndices_keeps_every_bucket_extreme():
+    y = np.random.default_rng(1).normal(size=1000)
+    indices = gfa.minMaxIndices(y, 102)
+    for bucket in np.array_split(np.arange(1000), 50):
+        assert bucket[np.argmin(y[bucket])] in indices and bucket[np.argmax(y[bucket])] in indices
+
+@pytest.mark.parametrize('method', ['minmax', 'lttb', None])
+def test_decimate_zooms_to_the_window_plus_one_point_either_side(method):
+    x = np.arange(1000)
+    y = np.sin(x/50.0)
+    xs, ys = gfa.decimate(x, y, xRange=(100.5, 200.5), maxPoints=1000, method=method)
+    np.testing.assert_array_equal(xs, np.arange(100, 202))
+    np.testing.assert_array_equal(ys, y[100:202])
+
+def test_decimate_clips_the_window_to_the_series():
+    x = np.arange(100)
+    xs, ys = gfa.decimate(x, x*2.0, xRange=(-50, 10), maxPoints=1000)
+    np.testing.assert_array_equal(xs, np.arange(12))
+    xs, ys = gfa.decimate(x, x*2.0, xRange=(90, 500), maxPoints=1000)
+    np.testing.assert_array_equal(xs, np.arange(89, 100))
+
+def test_decimate_limits_a_zoomed_trace_to_maxPoints():
+    x = np.arange(100000)
+    y = np.random.default_rng(2).normal(size=len(x))
+    xs, ys = gfa.decimate(x, y, xRange=(1000, 60000), maxPoints=500, method='minmax')
+    assert len(xs) <= 500 and xs[0] == 999 and xs[-1] == 60001
+    assert y[999:60002].max() in ys and y[999:60002].min() in ys
+
+def test_decimate_trims_series_of_different_lengths():
+    xs, ys = gfa.decimate(np.arange(10), np.arange(8.0), method=None)
+    assert len(xs) == len(ys) == 8
+
+
+# Job polling
+
+@pytest.fixture
+def pollContext():
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    token = context_value.set(AttributeDict(triggered_inputs=[{'prop_id': 'job-poll.n_intervals', 'value': 1}]))
+    yield
+    context_value.reset(token)
+
+def test_poll_resubmits_a_job_this_worker_does_not_know(pollContext):
+    gfa.gasFieldSim.simCache.clear()
+    params = dict(gfa.DEFAULT_PARAMS, simTime=2, numRigs=3)
+    stored = {'id': 'elsewhere', 'key': gfa.figureKey(params, gfa.SCENARIO_KEYS), 'params': params}
+    noInputs = [None]*len(gfa.PARAM_INPUTS)
+
+    stored, disabled, progress, simParams = gfa.update_job(1, *(noInputs + [stored]))
+    assert stored['id'] != 'elsewhere' and stored['params'] == params
+    for attempt in range(200):
+        if disabled:
+            break
+        time.sleep(0.01)
+        stored, disabled, progress, simParams = gfa.update_job(1, *(noInputs + [stored]))
+    assert disabled and simParams == params
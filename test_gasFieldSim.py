@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# Checks of the simulation engines against simulateFieldReference, the
+# day-by-day simulation stepping a WellFleet, and of the caches, scenario
+# grid and shared result store that serve their results. The reference
+# shares its decline curves and rig schedule with the engines, so it is in
+# turn pinned to values recorded from the original simulateField loop.
+#
+#   python -m pytest -q
+import functools
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import gasFieldSim as gfs
+from gasFieldGrid import ScenarioGrid, buildGrid
+from gasFieldStore import ResultStore, encodeTimeline
+
+
+SERIES_NAMES = ('tArr', 'qArr', 'expenseArr', 'incomeArr', 'decArr', 'exposureArr', 'numWellArr')
+
+# Short horizons keep the reference simulation quick
+SCENARIOS = {
+    'default': dict(gfs.DEFAULT_PARAMS, simTime=3),
+    'harmonic': dict(gfs.DEFAULT_PARAMS, simTime=3, declineModel='harmonic'),
+    'hyperbolic': dict(gfs.DEFAULT_PARAMS, simTime=3, declineModel='hyperbolic', bFactor=0.8),
+    'modifiedHyperbolic': dict(gfs.DEFAULT_PARAMS, simTime=3, declineModel='modifiedHyperbolic', bFactor=1.2,
+                               terminalDecline=8.0, aveDecline=2),
+    'rigStopTime': dict(gfs.DEFAULT_PARAMS, simTime=3, rigStopTime=1.5),
+    'flowSpread': dict(gfs.DEFAULT_PARAMS, simTime=3, flowSpread=0.5, wellSeed=3),
+    'flowSpreadHyperbolic': dict(gfs.DEFAULT_PARAMS, simTime=2, declineModel='hyperbolic', flowSpread=0.3, wellSeed=1),
+    'drillTime1': dict(gfs.DEFAULT_PARAMS, simTime=1, drillTime=1, numRigs=3),
+    'drillTime2': dict(gfs.DEFAULT_PARAMS, simTime=1, drillTime=2, fracWaitTime=0, pipeWaitTime=0),
+    'noRigs': dict(gfs.DEFAULT_PARAMS, simTime=1, numRigs=0),
+    'noTime': dict(gfs.DEFAULT_PARAMS, simTime=0)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def reference(name):
+    return gfs.simulateFieldReference(dict(SCENARIOS[name]))
+
+def assertSeriesClose(expected, actual):
+    assert len(actual) == len(SERIES_NAMES)
+    for seriesName, x, y in zip(SERIES_NAMES, expected, actual):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        assert x.shape == y.shape, seriesName
+        np.testing.assert_allclose(y, x, rtol=1.0E-9, atol=1.0E-3, err_msg=seriesName)
+
+def concatenateChunks(chunks):
+    if not chunks:
+        return tuple(np.zeros(0) for seriesName in SERIES_NAMES)
+    return tuple(np.concatenate([chunk[i] for chunk in chunks]) for i in range(len(SERIES_NAMES)))
+
+
+# Values recorded from the original per-Well simulateField loop, on days
+# (0, n//3, 2n//3, n - 1) of n days, and decArr's first and last values
+BASELINE = {
+    'default': (dict(gfs.DEFAULT_PARAMS), 1826, 1565, {
+        'qArr': (0.0, 18224079.208310265, 32349541.374009967, 39441261.59986587),
+        'expenseArr': (0.0, 200000000.0, 424000000.0, 645000000.0),
+        'incomeArr': (0.0, 50578007.31241542, 277153580.4524545, 582834924.3207431),
+        'numWellArr': (2, 42, 82, 122),
+        'decArr': (998424.1265562389, 84738.33129570144)}),
+    'drillTime1': (dict(gfs.DEFAULT_PARAMS, simTime=1, drillTime=1, numRigs=3), 366, 134, {
+        'qArr': (0.0, 0.0, 35628728.99148056, 359644636.5760598),
+        'expenseArr': (0.0, 1395000000.0, 3244500000.0, 5241000000.0),
+        'incomeArr': (0.0, 0.0, 3251108.9505939544, 344623122.5855325),
+        'numWellArr': (3, 366, 732, 1095),
+        'decArr': (998424.1265562389, 809503.9690891923)}),
+    'drillTime2': (dict(gfs.DEFAULT_PARAMS, simTime=1, drillTime=2, fracWaitTime=0, pipeWaitTime=0), 366, 353, {
+        'qArr': (0.0, 100827902.53553626, 193986059.88583106, 271266230.15866536),
+        'expenseArr': (0.0, 646000000.0, 1317000000.0, 1977000000.0),
+        'incomeArr': (0.0, 80317308.59178263, 332876680.6903695, 724474826.9470055),
+        'numWellArr': (2, 124, 246, 366),
+        'decArr': (998424.1265562389, 573084.5005394075)})
+}
+
+@pytest.mark.parametrize('simulate', [gfs.simulateFieldReference, gfs.simulateField])
+@pytest.mark.parametrize('name', sorted(BASELINE))
+def test_engines_match_the_original_loop(name, simulate):
+    params, numDays, numDecline, expected = BASELINE[name]
+    series = dict(zip(SERIES_NAMES, simulate(dict(params))))
+    assert len(series['tArr']) == numDays and len(series['decArr']) == numDecline
+    days = [0, numDays//3, 2*numDays//3, numDays - 1]
+    for seriesName, values in expected.items():
+        actual = np.asarray(series[seriesName], dtype=float)
+        actual = actual[[0, -1]] if seriesName == 'decArr' else actual[days]
+        np.testing.assert_allclose(actual, values, rtol=1.0E-12, err_msg=seriesName)
+
+@pytest.mark.parametrize('mode', gfs.SIM_MODES)
+@pytest.mark.parametrize('name', sorted(SCENARIOS))
+def test_simulateField_matches_reference(name, mode):
+    assertSeriesClose(reference(name), gfs.simulateField(dict(SCENARIOS[name]), mode=mode))
+
+@pytest.mark.parametrize('chunkDays', [1, 30, 365, 10000])
+@pytest.mark.parametrize('name', sorted(SCENARIOS))
+def test_iterSimulateField_chunks_match_reference(name, chunkDays):
+    chunks = list(gfs.iterSimulateField(dict(SCENARIOS[name]), chunkDays))
+    assert all(len(chunk[0]) <= chunkDays for chunk in chunks)
+    assertSeriesClose(reference(name), concatenateChunks(chunks))
+
+@pytest.mark.parametrize('declineModel', gfs.DECLINE_MODELS)
+def test_iterSimulateField_matches_simulateField_over_decades(declineModel):
+    params = dict(gfs.DEFAULT_PARAMS, simTime=40, numRigs=4, drillTime=10, rigStopTime=30, declineModel=declineModel,
+                  flowSpread=0.4, wellSeed=5)
+    assertSeriesClose(gfs.simulateField(params), concatenateChunks(list(gfs.iterSimulateField(params, 365))))
+
+EXPONENTIAL_SCENARIOS = sorted(name for name, params in SCENARIOS.items()
+                               if gfs.declineParams(params)['declineModel'] == 'exponential')
+
+@pytest.mark.parametrize('name', EXPONENTIAL_SCENARIOS)
+def test_simulateFieldEvents_matches_simulateField_on_whole_days(name):
+    params = dict(SCENARIOS[name])
+    assertSeriesClose(gfs.simulateField(params), gfs.simulateFieldEvents(params))
+
+def test_simulateFieldEvents_reports_between_days():
+    params = dict(SCENARIOS['flowSpread'])
+    tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = gfs.simulateField(params)
+    reportTimes = np.arange(0.0, len(tArr) - 1, 0.25)
+    days = np.floor(reportTimes).astype(int)
+    nextDays = np.ceil(reportTimes).astype(int)
+    events = dict(zip(SERIES_NAMES, gfs.simulateFieldEvents(params, reportTimes)))
+    # wells flow from tie-in, declining continuously to the next day's flow;
+    # what has been paid and sold changes by the day
+    expParam = 2.30259/(params['aveDecline']*365.0)
+    np.testing.assert_allclose(events['qArr'], qArr[nextDays]*np.exp(expParam*(nextDays - reportTimes)), rtol=1.0E-9)
+    np.testing.assert_allclose(events['incomeArr'], incomeArr[days], rtol=1.0E-9)
+    np.testing.assert_array_equal(events['expenseArr'], expenseArr[days])
+    np.testing.assert_array_equal(events['numWellArr'], numWellArr[days])
+
+@pytest.mark.parametrize('priceDay', [400, 400.5, 0])
+def test_simulateFieldEvents_prices_each_day_at_its_gas_price(priceDay):
+    params = dict(SCENARIOS['rigStopTime'], priceSchedule=[(priceDay, 6.0), (900, 12.0)])
+    tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = gfs.simulateField(params)
+    gasPrice = np.where(tArr >= 900, 12.0, np.where(tArr >= priceDay, 6.0, params['gasPrice']))
+    expected = np.cumsum(gasPrice*params['exchangeRate']*qArr/947.8171)
+    events = dict(zip(SERIES_NAMES, gfs.simulateFieldEvents(params)))
+    np.testing.assert_allclose(events['incomeArr'], expected, rtol=1.0E-9, atol=1.0E-3)
+    np.testing.assert_allclose(events['exposureArr'], expected - expenseArr, rtol=1.0E-9, atol=1.0E-3)
+
+def test_simulateFieldEvents_needs_exponential_decline():
+    with pytest.raises(ValueError):
+        gfs.simulateFieldEvents(dict(SCENARIOS['hyperbolic']))
+
+def test_every_decline_model_is_checked():
+    models = {gfs.declineParams(params)['declineModel'] for params in SCENARIOS.values()}
+    assert models == set(gfs.DECLINE_MODELS)
+
+
+# Caches
+
+@pytest.fixture
+def caches():
+    for cache in (gfs.simCache, gfs.physicsCache, gfs.summaryCache):
+        cache.clear()
+    yield gfs.simCache
+    for cache in (gfs.simCache, gfs.physicsCache, gfs.summaryCache):
+        cache.clear()
+
+def test_cachedSimulateField_matches_and_hits(caches):
+    params = SCENARIOS['flowSpread']
+    assertSeriesClose(reference('flowSpread'), gfs.cachedSimulateField(dict(params)))
+    assert gfs.cachedSimulateField(dict(params)) is gfs.cachedSimulateField(dict(params))
+    assert caches.getStats()['misses'] == 1
+
+def test_cached_results_are_read_only(caches):
+    qArr = gfs.cachedSimulateField(dict(SCENARIOS['default']))[1]
+    with pytest.raises(ValueError):
+        qArr[0] = 1.0
+
+def test_cache_key_ignores_what_does_not_change_the_simulation(caches):
+    params = SCENARIOS['default']
+    results = gfs.cachedSimulateField(dict(params))
+    assert gfs.cachedSimulateField(dict(params, tgtFlow=99.0)) is results
+    assert gfs.cachedSimulateField(dict(params, rigStopTime=params['simTime'])) is results
+    assert gfs.cachedSimulateField(dict(params, **gfs.DECLINE_DEFAULTS)) is results
+    assert gfs.cachedSimulateField(dict(params, gasPrice=11.0)) is not results
+
+def test_SimulationCache_evicts_least_recently_used():
+    cache = gfs.SimulationCache(maxSize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+
+def test_SimulationCache_expires_entries():
+    cache = gfs.SimulationCache(ttl=-1.0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+
+
+# Scenario grid
+
+GRID_AXES = {'drillTime': [20, 30], 'aveDecline': [3, 4]}
+
+@pytest.fixture(scope='module')
+def gridPath(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('grid') / 'grid.npy')
+    buildGrid(path, GRID_AXES, simTime=3, workers=1)
+    return path
+
+@pytest.mark.parametrize('simTime', [0, 1, 3])
+def test_grid_lookup_matches_simulation(gridPath, simTime):
+    grid = ScenarioGrid.load(gridPath)
+    params = dict(gfs.DEFAULT_PARAMS, simTime=simTime, drillTime=20, aveDecline=4, numRigs=3, aveFlow=1.7)
+    timeline = grid.lookup(params)
+    expected = gfs.simulatePhysics(params)
+    for name in ('tArr', 'decArr', 'numWellArr', 'drilledArr', 'frackedArr', 'tiedInArr'):
+        np.testing.assert_array_equal(getattr(timeline, name), getattr(expected, name), err_msg=name)
+    np.testing.assert_allclose(timeline.qArr, expected.qArr, rtol=1.0E-6, atol=1.0E-3)
+
+@pytest.mark.parametrize('change', [{'drillTime': 25}, {'simTime': 4}, {'fracTime': 11}, {'flowSpread': 0.2},
+                                    {'rigStopTime': 1}, {'aveDecline': 3.5}])
+def test_grid_misses_scenarios_off_it(gridPath, change):
+    params = dict(dict(gfs.DEFAULT_PARAMS, simTime=3, drillTime=30, aveDecline=3), **change)
+    assert ScenarioGrid.load(gridPath).lookup(params) is None
+
+def test_grid_interpolates_only_when_asked(gridPath):
+    params = dict(gfs.DEFAULT_PARAMS, simTime=3, drillTime=30, aveDecline=3.5)
+    grid = ScenarioGrid.load(gridPath, interpolate=True)
+    timeline = grid.lookup(params)
+    low = grid.lookup(dict(params, aveDecline=3))
+    high = grid.lookup(dict(params, aveDecline=4))
+    np.testing.assert_allclose(timeline.qArr, 0.5*(low.qArr + high.qArr), rtol=1.0E-6)
+    np.testing.assert_allclose(timeline.qArr, gfs.simulatePhysics(params).qArr, rtol=0.02, atol=1.0E-3)
+
+
+# Shared result store
+
+def assertTimelinesEqual(expected, actual):
+    for name in ('tArr', 'qArr', 'decArr', 'numWellArr', 'drilledArr', 'frackedArr', 'tiedInArr'):
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name), err_msg=name)
+
+def test_store_computes_once_across_instances(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    params = dict(SCENARIOS['hyperbolic'])
+    calls = []
+    def compute():
+        calls.append(1)
+        return gfs.simulatePhysics(params)
+    first = ResultStore(path).getOrCompute('key', compute)
+    second = ResultStore(path).getOrCompute('key', compute)
+    assert len(calls) == 1
+    assertTimelinesEqual(first, second)
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = ResultStore(str(tmp_path / 'store.sqlite'), maxBytes=2500)
+    for key in 'abc':
+        store.put(key, b'x'*1000)
+        time.sleep(0.01)
+    assert store.getStats()['bytes'] <= 2500
+    assert 'a' not in store and 'b' in store and 'c' in store
+
+def test_store_claims_are_exclusive_until_stale(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    store, other = ResultStore(path), ResultStore(path, claimTimeout=0.0)
+    assert store.claim('key')
+    assert not store.claim('key')
+    time.sleep(0.01)
+    assert other.claim('key')
+    other.release('key')
+    assert store.claim('key')
+
+def test_store_waits_for_a_claimed_result(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    store, other = ResultStore(path), ResultStore(path, pollInterval=0.01)
+    params = dict(SCENARIOS['default'])
+    assert store.claim('key')
+    def finish():
+        time.sleep(0.1)
+        store.put('key', encodeTimeline(gfs.simulatePhysics(params)))
+        store.release('key')
+    worker = threading.Thread(target=finish)
+    worker.start()
+    timeline = other.getOrCompute('key', lambda: pytest.fail('computed a claimed result'))
+    worker.join()
+    assertTimelinesEqual(gfs.simulatePhysics(params), timeline)
+    assert other.getStats()['waits'] == 1
+
+def test_store_shares_job_status(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    store, other = ResultStore(path), ResultStore(path)
+    params = dict(SCENARIOS['default'])
+    store.putJob('job', 'running', 0.5, None, params)
+    other.cancelJob('job')
+    assert store.isJobCancelled('job')
+    assert other.getJob('job') == {'status': 'running', 'progress': 0.5, 'error': None, 'params': params,
+                                   'cancelled': True}
+    assert other.getJob('missing') is None
+
+def test_cachedSimulatePhysics_fills_the_store(tmp_path, caches):
+    store = ResultStore(str(tmp_path / 'store.sqlite'))
+    params = dict(SCENARIOS['rigStopTime'])
+    gfs.setResultStore(store)
+    try:
+        timeline = gfs.cachedSimulatePhysics(params)
+        assert gfs.inResultStore(params)
+        gfs.physicsCache.clear()
+        assertTimelinesEqual(timeline, gfs.cachedSimulatePhysics(params))
+        assert store.getStats()['hits'] == 1
+    finally:
+        gfs.setResultStore(None)
+
+
+# Field summary
+
+def summarise(params):
+    return gfs.fieldSummary(gfs.simulatePhysics(params), params)
+
+def npvAt(params, rate):
+    tArr, qArr, expenseArr, incomeArr, decArr, exposureArr, numWellArr = gfs.simulateField(params)
+    return float(np.sum(np.diff(exposureArr, prepend=0.0)*(1.0 + rate)**(-tArr/365.0)))
+
+@pytest.mark.parametrize('params', [dict(gfs.DEFAULT_PARAMS), dict(gfs.DEFAULT_PARAMS, gasPrice=20.0),
+                                    dict(gfs.DEFAULT_PARAMS, simTime=10, rigStopTime=3, declineModel='hyperbolic')])
+def test_summary_npv_is_zero_at_the_irr_and_breakeven_price(params):
+    summary = summarise(params)
+    scale = gfs.peakExposure(gfs.simulateField(params)[5])
+    for rate in gfs.SUMMARY_DISCOUNT_RATES:
+        np.testing.assert_allclose(summary.npv[rate], npvAt(params, rate), rtol=1.0E-9)
+        breakeven = summarise(dict(params, gasPrice=summary.breakevenGasPrice[rate]))
+        assert abs(breakeven.npv[rate]) < 1.0E-9*scale
+    assert summary.irr is not None
+    assert abs(npvAt(params, summary.irr)) < 1.0E-6*scale
+
+def test_summary_payback_day_is_when_exposure_turns_for_good():
+    params = dict(gfs.DEFAULT_PARAMS, simTime=10, rigStopTime=3)
+    exposureArr = gfs.simulateField(params)[5]
+    paybackDay = summarise(params).paybackDay
+    assert paybackDay is not None and exposureArr[paybackDay - 1] < 0.0
+    assert np.all(exposureArr[paybackDay:] >= 0.0)
+    assert summarise(dict(gfs.DEFAULT_PARAMS)).paybackDay is None
+
+def test_summary_of_a_field_without_rigs():
+    summary = summarise(dict(gfs.DEFAULT_PARAMS, numRigs=0))
+    assert all(npv == 0.0 for npv in summary.npv.values())
+    assert all(price is None for price in summary.breakevenGasPrice.values())
+    assert summary.irr is None and summary.paybackDay == 0
+    assert summary.peakExposure == 0.0 and summary.totalGas == summary.totalExpense == 0.0
+
+
+# Development optimizer
+
+def test_optimizePlan_leaves_the_shared_caches_alone(caches):
+    params = dict(gfs.DEFAULT_PARAMS, simTime=3, tgtFlow=5.0)
+    gfs.cachedSimulateField(params)
+    result = gfs.optimizePlan(params, plateauTime=1.0, drillTimes=range(20, 45, 5), rigStopStep=0.5)
+    assert result['best'] is not None and result['evaluated'] > 1
+    assert len(gfs.simCache.entries) == 1 and len(gfs.physicsCache.entries) == 1
+    assert gfs.plateauLevel(gfs.simulateField(result['best']['params'])[1], 365) >= 5.0*947817.12
+
+def test_optimizePlan_with_flowSpread_reports_the_plan_it_returns():
+    params = dict(gfs.DEFAULT_PARAMS, tgtFlow=60.0, flowSpread=0.8)
+    best = gfs.optimizePlan(params, drillTimes=range(10, 35, 5))['best']
+    series = gfs.simulateField(best['params'])
+    assert best['plateauFlow'] == gfs.plateauLevel(series[1], 730) >= 60.0*947817.12
+    assert best['peakExposure'] == gfs.peakExposure(series[5])
+
+
+# Portfolio scheduling
+
+def test_balanced_schedule_shares_rigs_between_limited_and_unlimited_fields():
+    fields = [gfs.Field('limited', params=dict(gfs.DEFAULT_PARAMS, maxWells=10)),
+              gfs.Field('open', params=dict(gfs.DEFAULT_PARAMS))]
+    spudCount = gfs.scheduleRigs(fields, 2, 365, policy='balanced')
+    cumulative = np.cumsum(spudCount, axis=1)
+    filling = cumulative[0] < 10
+    assert np.all(np.abs(cumulative[0] - cumulative[1])[filling] <= 1)
+    assert cumulative[0, -1] == 10 and cumulative[1, -1] > 10
+
+def test_priority_schedule_fills_fields_in_order():
+    fields = [gfs.Field('first', params=dict(gfs.DEFAULT_PARAMS, maxWells=4)),
+              gfs.Field('second', params=dict(gfs.DEFAULT_PARAMS))]
+    spudCount = gfs.scheduleRigs(fields, 2, 365, policy='priority')
+    firstDone = np.flatnonzero(np.cumsum(spudCount[0]) == 4)[0]
+    assert spudCount[0].sum() == 4 and not spudCount[1, :firstDone].any()